@@ -35,7 +35,7 @@ export async function fetchMe() {
 }
 
 export async function fetchRecentlyPlayed(limit = 20) {
-  const data = await apiFetch(`/recently-played?limit=${limit}`);
+  const data = await apiFetch(`/recently-played?limit=${limit}&compact=1`);
 
   // サーバの返しが:
   // ① { items: [ {track: {...}}, {...track無し...} ] }（items内がオブジェクト）
@@ -48,17 +48,42 @@ export async function fetchRecentlyPlayed(limit = 20) {
 
 
 export async function fetchRecommendationsFromRecent(limit = 12) {
-  const data = await apiFetch(`/recommendations?limit=${limit}`);
+  const data = await apiFetch(`/recommendations?limit=${limit}&compact=1`);
   return data.tracks || [];
 }
 
 export async function fetchLikedTracks(limit = 20, offset = 0) {
-  const data = await apiFetch(`/liked-tracks?limit=${limit}&offset=${offset}`);
+  const data = await apiFetch(`/liked-tracks?limit=${limit}&offset=${offset}&compact=1`);
   const items = Array.isArray(data?.items) ? data.items : [];
   const tracks = items.map(it => it?.track ?? it).filter(Boolean);
   return { tracks, total: data?.total ?? tracks.length };
 }
 
+// 画面に必要なセクションを1リクエストでまとめて取得する
+// fields: ["me", "recently_played", "recommendations", "recent", "liked", "audio_features"]
+export async function fetchDashboard(fields = [], { recentLimit = 12, likedLimit = 20, likedOffset = 0 } = {}) {
+  const params = new URLSearchParams({
+    recent_limit: String(recentLimit),
+    liked_limit: String(likedLimit),
+    liked_offset: String(likedOffset),
+    compact: "1"
+  });
+  if (fields.length) params.set("fields", fields.join(","));
+  const data = await apiFetch(`/dashboard?${params}`);
+
+  // サーバは曲本体を tracks にまとめて返すので、IDから曲オブジェクトに戻す
+  const byId = data.tracks || {};
+  const expand = (ids) => (ids || []).map(id => byId[id]).filter(Boolean);
+  const out = { errors: data.errors || {}, stale: data.stale || [] };
+  if (data.me) out.me = data.me;
+  if (data.recently_played) out.recentlyPlayed = expand(data.recently_played);
+  if (data.recommendations) out.recommendations = expand(data.recommendations);
+  if (data.recent) out.recent = data.recent.map(e => ({ ...e, tracks: expand(e.track_ids) }));
+  if (data.liked) out.liked = { tracks: expand(data.liked.ids), total: data.liked.total };
+  if (data.audio_features) out.audioFeatures = Object.values(data.audio_features);
+  return out;
+}
+
 export async function fetchAudioFeatures(trackIds = []) {
   if (!trackIds.length) return [];
   const ids = trackIds.join(",");
@@ -77,9 +102,23 @@ export function buildSingabilityMap(featuresList) {
   return map;
 }
 
+// 歌いやすさスコアをサーバで一括計算（buildSingabilityMap と同じ形の Map を返す）
+export async function fetchSingabilityMap(trackIds = []) {
+  const map = new Map();
+  if (!trackIds.length) return map;
+  const data = await apiFetch(`/singability`, {
+    method: "POST",
+    body: JSON.stringify({ ids: trackIds })
+  });
+  for (const s of data.scores || []) {
+    map.set(s.id, { tempo: s.tempo, key: s.key, scorePartial: s.scorePartial });
+  }
+  return map;
+}
+
 // 最近のおすすめ履歴（サーバのセッションに保持）
 export async function fetchRecommendationHistory() {
-  const data = await apiFetch(`/recommendations/recent`);
+  const data = await apiFetch(`/recommendations/recent?compact=1`);
   return data.entries || [];
 }
 
@@ -1,16 +1,10 @@
 "use client"
 
-import { useEffect, useRef, useState } from "react"
+import { useEffect, useState } from "react"
 import Header from "../components/Header"
 import RecentPlayList from "../components/RecentPlayList"
 import RecommendationList from "../components/RecommendationList"
-import {
-  fetchMe,
-  fetchRecentlyPlayed,
-  fetchRecommendationsFromRecent,
-  fetchLikedTracks,
-  loginWithSpotify,
-} from "../api/spotify"
+import { fetchDashboard, fetchSingabilityMap, loginWithSpotify } from "../api/spotify"
 import { useNavigate } from "react-router-dom"
 import useSelectedStore from "../hooks/useSelectedStore"
 
@@ -25,90 +19,65 @@ export default function AddPage() {
   })
   const [recent, setRecent] = useState([])
   const [currentRecs, setCurrentRecs] = useState([])
+  const [featuresMap, setFeaturesMap] = useState(null)
   const [liked, setLiked] = useState([])
   const [likedLoading, setLikedLoading] = useState(false)
   const [likedError, setLikedError] = useState("")
   const [recsLoading, setRecsLoading] = useState(false)
   const { addSelected } = useSelectedStore()
 
-  useEffect(() => {
-    fetchMe()
-      .then((u) => {
-        localStorage.setItem("spotify_user", JSON.stringify(u))
-        setUser(u)
-      })
-      .catch(() => navigate("/login"))
-    // eslint-disable-next-line react-hooks/exhaustive-deps
-  }, [])
-
-  // 最近再生
+  // プロフィール・最近再生・おすすめ・お気に入りを1リクエストで取得
+  // （StrictMode の開発時二重実行では1回目の結果を mounted で捨て、2回目の結果を使う）
   useEffect(() => {
     let mounted = true
+    setRecsLoading(true)
+    setLikedLoading(true)
     ;(async () => {
       try {
-        const recents = await fetchRecentlyPlayed(12)
+        const data = await fetchDashboard(["me", "recently_played", "recommendations", "liked"], {
+          recentLimit: 12,
+          likedLimit: 20,
+          likedOffset: 0,
+        })
         if (!mounted) return
-        setRecent(recents)
-      } catch (e) {
-        console.error(e)
-      }
-    })()
-    return () => {
-      mounted = false
-    }
-  }, [])
-
-  // おすすめ自動生成（一度だけ）
-  const generatedOnceRef = useRef(false)
-  useEffect(() => {
-    if (!user) return
-    if (generatedOnceRef.current) return
-    generatedOnceRef.current = true
-    ;(async () => {
-      try {
-        setRecsLoading(true)
-        const tracks = await fetchRecommendationsFromRecent(12)
-        const uniq = []
-        const seen = new Set()
-        for (const t of Array.isArray(tracks) ? tracks : []) {
-          const id = t && t.id
-          if (id && !seen.has(id)) {
-            seen.add(id)
-            uniq.push(t)
-          }
+        if (!data.me) {
+          navigate("/login")
+          return
+        }
+        localStorage.setItem("spotify_user", JSON.stringify(data.me))
+        setUser(data.me)
+        setRecent(data.recentlyPlayed || [])
+        setCurrentRecs(data.recommendations || [])
+        // BPM / Key はサーバで計算したスコアを後から載せる（失敗してもカードはそのまま出す）
+        const recIds = (data.recommendations || []).map(t => t.id)
+        fetchSingabilityMap(recIds)
+          .then(map => {
+            if (mounted) setFeaturesMap(map)
+          })
+          .catch(e => console.error(e))
+        if (data.liked) {
+          setLiked(data.liked.tracks)
+        } else {
+          console.error(data.errors.liked)
+          setLikedError(
+            "お気に入りの取得に失敗しました。スコープ(user-library-read)が不足している可能性があります。ヘッダーからログアウトし、再ログインしてください。",
+          )
         }
-        setCurrentRecs(uniq)
-      } catch (e) {
-        console.error(e)
-      } finally {
-        setRecsLoading(false)
-      }
-    })()
-  }, [user])
-
-  // お気に入り（Liked Songs）
-  useEffect(() => {
-    if (!user) return
-    let mounted = true
-    ;(async () => {
-      try {
-        setLikedLoading(true)
-        const { tracks } = await fetchLikedTracks(20, 0)
-        if (!mounted) return
-        setLiked(tracks)
       } catch (e) {
         console.error(e)
-        setLikedError(
-          "お気に入りの取得に失敗しました。スコープ(user-library-read)が不足している可能性があります。ヘッダーからログアウトし、再ログインしてください。",
-        )
+        navigate("/login")
       } finally {
-        setLikedLoading(false)
+        if (mounted) {
+          setRecsLoading(false)
+          setLikedLoading(false)
+        }
       }
     })()
     return () => {
       mounted = false
     }
-  }, [user])
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [])
 
   if (!user) return null
 
@@ -143,7 +112,7 @@ export default function AddPage() {
         {recsLoading ? (
           <div>おすすめを準備中…</div>
         ) : (
-          <RecommendationList tracks={currentRecs} onAddSelected={addSelected} />
+          <RecommendationList tracks={currentRecs} featuresMap={featuresMap} onAddSelected={addSelected} />
         )}
       </section>
     </div>
@@ -2,15 +2,35 @@
 import os
 import time
 import random
+import hashlib
+import threading
 
-from flask import Flask, jsonify, redirect, request, session, make_response
+from flask import Flask, jsonify, redirect, request, session, make_response, Response, stream_with_context, g
 from flask_cors import CORS
+from flask_compress import Compress
 from dotenv import load_dotenv
 
-import spotipy
-from spotipy.oauth2 import SpotifyOAuth
 from spotipy.exceptions import SpotifyException
-from spotipy.cache_handler import MemoryCacheHandler
+
+import metrics
+from spotify_client import SpotifyClientFactory
+from governor import Governor, INTERACTIVE, BACKGROUND, background
+from circuit_breaker import CircuitBreakers, LastKnownGood
+from cache_utils import LRUTTLCache, SingleFlight
+from playlist_cache import PlaylistCache
+from discovery_cache import QueryCache, DeadPlaylists
+from fanout import FanOut, wait_result, first_in_order, remaining
+from source_index import SourceIndex, build_sources
+from track_store import TrackStore, compact_track
+from audio_features import FeatureStore, singability_scores
+from recommender import Recommender
+from candidate_pool import CandidatePool
+from token_manager import TokenManager
+from liked_export import LikedSnapshots, PAGE_SIZE as LIKED_PAGE_SIZE, fetch_first_page, stream_export
+from play_log import PlayLog, iso_from_ms
+from prefetch import PrefetchJobs
+from snapshot import Snapshots
+from session_store import ServerSideSessionInterface, MemorySessionBackend, SqliteSessionBackend
 
 load_dotenv()
 
@@ -36,12 +56,133 @@ SECRET_KEY = os.environ.get("FLASK_SECRET_KEY", "change-me-please")
 # Primary recommendation source: Sample Playlist (override via env if needed)
 RECOMMENDATION_PLAYLIST_ID = os.environ.get("RECOMMENDATION_PLAYLIST_ID", "4FhlAvZc0SJXqy1WVcHo7q")
 
+# Spotify HTTP client (shared keep-alive pool, retry/backoff on 429/5xx)
+SPOTIFY_POOL_SIZE = int(os.environ.get("SPOTIFY_POOL_SIZE", "20"))
+SPOTIFY_TIMEOUT = float(os.environ.get("SPOTIFY_TIMEOUT", "5"))
+SPOTIFY_RETRIES = int(os.environ.get("SPOTIFY_RETRIES", "3"))
+SPOTIFY_BACKOFF = float(os.environ.get("SPOTIFY_BACKOFF", "0.3"))
+SPOTIFY_RETRY_AFTER_MAX = float(os.environ.get("SPOTIFY_RETRY_AFTER_MAX", "10"))
+# ベンチ用: ローカルのスタンドイン (fake_spotify.py) に向ける
+SPOTIFY_API_BASE = os.environ.get("SPOTIFY_API_BASE", "")
+
+# Client-side rate limit for all Spotify calls (0 disables). SHARED_PATH shares the bucket across worker processes
+SPOTIFY_RATE = float(os.environ.get("SPOTIFY_RATE", "20"))
+SPOTIFY_RATE_BURST = int(os.environ.get("SPOTIFY_RATE_BURST", "40"))
+SPOTIFY_QUEUE_MAX_WAIT = float(os.environ.get("SPOTIFY_QUEUE_MAX_WAIT", "10"))
+SPOTIFY_RATE_SHARED_PATH = os.environ.get("SPOTIFY_RATE_SHARED_PATH", "")
+
+# Circuit breaker per Spotify endpoint: opens when errors or slow calls (>= BREAKER_SLOW_CALL s) reach the given
+# rate within BREAKER_WINDOW s; while open, routes serve the last known good response flagged "stale"
+BREAKER_ENABLED = os.environ.get("BREAKER_ENABLED", "true").lower() == "true"
+BREAKER_WINDOW = float(os.environ.get("BREAKER_WINDOW", "30"))
+BREAKER_MIN_CALLS = int(os.environ.get("BREAKER_MIN_CALLS", "10"))
+BREAKER_ERROR_RATE = float(os.environ.get("BREAKER_ERROR_RATE", "0.5"))
+BREAKER_SLOW_CALL = float(os.environ.get("BREAKER_SLOW_CALL", "2.0"))
+BREAKER_SLOW_RATE = float(os.environ.get("BREAKER_SLOW_RATE", "0.5"))
+BREAKER_OPEN_FOR = float(os.environ.get("BREAKER_OPEN_FOR", "15"))
+LAST_GOOD_SIZE = int(os.environ.get("LAST_GOOD_SIZE", "500"))
+LAST_GOOD_TTL = int(os.environ.get("LAST_GOOD_TTL", "86400"))
+
+# Token refresh: inline below TOKEN_REFRESH_MARGIN, in the background below TOKEN_REFRESH_AHEAD
+TOKEN_REFRESH_MARGIN = int(os.environ.get("TOKEN_REFRESH_MARGIN", "60"))
+TOKEN_REFRESH_AHEAD = int(os.environ.get("TOKEN_REFRESH_AHEAD", "300"))
+TOKEN_REFRESH_INTERVAL = int(os.environ.get("TOKEN_REFRESH_INTERVAL", "30"))
+
+# Server-side session store: sqlite (default, survives restarts) | cookie (Flask default signed cookie) |
+# memory (explicit opt-in: every restart, including debug auto-reload, logs everyone out)
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "sqlite").lower()
+SESSION_DB_PATH = os.environ.get("SESSION_DB_PATH", "sessions.sqlite3")
+SESSION_TTL = int(os.environ.get("SESSION_TTL", str(7 * 24 * 3600)))
+
+# Metrics: /api/_metrics (Prometheus text) and optional Server-Timing header
+METRICS_SERVER_TIMING = os.environ.get("METRICS_SERVER_TIMING", "false").lower() == "true"
+
+# Shared playlist cache (process-wide, keyed by playlist id + market)
+PLAYLIST_CACHE_SIZE = int(os.environ.get("PLAYLIST_CACHE_SIZE", "128"))
+PLAYLIST_CACHE_TTL = int(os.environ.get("PLAYLIST_CACHE_TTL", "300"))
+
+# Discovery caches: search / category listings, and backoff for dead playlists (403/404/empty)
+DISCOVERY_CACHE_SIZE = int(os.environ.get("DISCOVERY_CACHE_SIZE", "512"))
+DISCOVERY_CACHE_TTL = int(os.environ.get("DISCOVERY_CACHE_TTL", "1800"))
+DEAD_PLAYLIST_BACKOFF = int(os.environ.get("DEAD_PLAYLIST_BACKOFF", "300"))
+DEAD_PLAYLIST_MAX_BACKOFF = int(os.environ.get("DEAD_PLAYLIST_MAX_BACKOFF", "86400"))
+
+# Per-user profile cache (/me), filled at login and refreshed lazily
+PROFILE_CACHE_SIZE = int(os.environ.get("PROFILE_CACHE_SIZE", "1024"))
+PROFILE_CACHE_TTL = int(os.environ.get("PROFILE_CACHE_TTL", "900"))
+
+# Shared track metadata store (memory LRU + optional SQLite file)
+TRACK_STORE_SIZE = int(os.environ.get("TRACK_STORE_SIZE", "20000"))
+TRACK_STORE_PATH = os.environ.get("TRACK_STORE_PATH", "")
+
+# Audio features never change per track id: cache without expiry
+AUDIO_FEATURES_SIZE = int(os.environ.get("AUDIO_FEATURES_SIZE", "20000"))
+AUDIO_FEATURES_PATH = os.environ.get("AUDIO_FEATURES_PATH", "")
+SINGABILITY_MAX_IDS = int(os.environ.get("SINGABILITY_MAX_IDS", "500"))
+
+# Liked-tracks export (NDJSON stream + per-user incremental snapshot)
+LIKED_EXPORT_CONCURRENCY = int(os.environ.get("LIKED_EXPORT_CONCURRENCY", "4"))
+LIKED_SNAPSHOT_PATH = os.environ.get("LIKED_SNAPSHOT_PATH", "")
+
+# Play log（最近再生を貯めていくローカル履歴）
+PLAY_LOG_PATH = os.environ.get("PLAY_LOG_PATH", "")
+PLAY_LOG_SYNC_INTERVAL = int(os.environ.get("PLAY_LOG_SYNC_INTERVAL", "30"))
+
+# Parallel fan-out for upstream calls (bounded thread pool)
+FANOUT_WORKERS = int(os.environ.get("FANOUT_WORKERS", "8"))
+RECS_FALLBACK_DEADLINE = float(os.environ.get("RECS_FALLBACK_DEADLINE", "8"))
+RECS_FALLBACK_MAX_CANDIDATES = int(os.environ.get("RECS_FALLBACK_MAX_CANDIDATES", "20"))
+
+# Local recommender（聴取履歴の特徴量で候補を並べる。使えないときはランダム抽出）
+RECS_LOCAL = os.environ.get("RECS_LOCAL", "true").lower() == "true"
+RECS_SEED_RECENT = int(os.environ.get("RECS_SEED_RECENT", "50"))
+RECS_SEED_LIKED = int(os.environ.get("RECS_SEED_LIKED", "200"))
+RECS_RANK_CANDIDATES = int(os.environ.get("RECS_RANK_CANDIDATES", "200"))
+
+# Candidate pool（ソースプレイリストを全ページ読み込み、列指向で保持）
+CANDIDATE_POOL_TTL = int(os.environ.get("CANDIDATE_POOL_TTL", "3600"))
+CANDIDATE_POOL_MAX_PER_SOURCE = int(os.environ.get("CANDIDATE_POOL_MAX_PER_SOURCE", "2000"))
+CANDIDATE_POOL_SOURCES = int(os.environ.get("CANDIDATE_POOL_SOURCES", "10"))
+
+# Login prefetch（ログイン直後に最近再生・お気に入り・おすすめ・特徴量を先読み）
+PREFETCH_ON_LOGIN = os.environ.get("PREFETCH_ON_LOGIN", "true").lower() == "true"
+PREFETCH_TTL = int(os.environ.get("PREFETCH_TTL", "120"))
+PREFETCH_WAIT = float(os.environ.get("PREFETCH_WAIT", "10"))
+
+# Dashboard（複数セクションを1リクエストでまとめて返す）
+DASHBOARD_DEADLINE = float(os.environ.get("DASHBOARD_DEADLINE", "10"))
+DASHBOARD_WORKERS = int(os.environ.get("DASHBOARD_WORKERS", "8"))
+
+# Shared-cache snapshot (restored at startup, rewritten every SNAPSHOT_INTERVAL s; empty path disables)
+SNAPSHOT_PATH = os.environ.get("SNAPSHOT_PATH", "")
+SNAPSHOT_INTERVAL = int(os.environ.get("SNAPSHOT_INTERVAL", "600"))
+SNAPSHOT_MAX_AGE = int(os.environ.get("SNAPSHOT_MAX_AGE", "86400"))
+
+# Recommendation-source index (per market, refreshed in the background)
+SOURCE_INDEX_PATH = os.environ.get("SOURCE_INDEX_PATH", "")
+SOURCE_INDEX_MAX_AGE = int(os.environ.get("SOURCE_INDEX_MAX_AGE", "3600"))
+SOURCE_INDEX_REFRESH_INTERVAL = int(os.environ.get("SOURCE_INDEX_REFRESH_INTERVAL", "300"))
+
 app = Flask(__name__)
 app.secret_key = SECRET_KEY
 
+# セッションの中身はサーバ側に置き、Cookie には ID だけを載せる
+if SESSION_BACKEND == "sqlite":
+    app.session_interface = ServerSideSessionInterface(SqliteSessionBackend(SESSION_DB_PATH), ttl=SESSION_TTL)
+elif SESSION_BACKEND == "memory":
+    app.session_interface = ServerSideSessionInterface(MemorySessionBackend(), ttl=SESSION_TTL)
+
 # CORS: フロントからCookie送信可
 CORS(app, resources={r"/api/*": {"origins": FRONTEND_ORIGINS}}, supports_credentials=True)
 
+# JSON レスポンスを br / gzip で圧縮（NDJSON ストリームは逐次届くよう対象外）
+app.config.update(
+    COMPRESS_ALGORITHM=["br", "gzip"],
+    COMPRESS_MIMETYPES=["application/json"],
+    COMPRESS_STREAMS=False,
+)
+Compress(app)
+
 # 本番で別オリジン/HTTPSの場合はクロスサイトCookieを有効化
 if os.environ.get("COOKIE_CROSS_SITE", "false").lower() == "true":
     app.config.update(
@@ -55,50 +196,230 @@ else:
         SESSION_COOKIE_SECURE=False,
     )
 
+governor = None
+if SPOTIFY_RATE > 0:
+    governor = Governor(
+        rate=SPOTIFY_RATE,
+        burst=SPOTIFY_RATE_BURST,
+        max_wait=SPOTIFY_QUEUE_MAX_WAIT,
+        shared_path=SPOTIFY_RATE_SHARED_PATH,
+    )
+    metrics.registry.gauge("karapoke_spotify_queue_depth_interactive",
+                           "Interactive callers waiting for a rate-limit slot.", lambda: governor.queue_depth(INTERACTIVE))
+    metrics.registry.gauge("karapoke_spotify_queue_depth_background",
+                           "Background callers waiting for a rate-limit slot.", lambda: governor.queue_depth(BACKGROUND))
+    metrics.registry.gauge("karapoke_spotify_rate_limit",
+                           "Current client-side Spotify request rate (req/s) after 429 back-off.", lambda: governor.current_rate())
+
+breakers = None
+if BREAKER_ENABLED:
+    breakers = CircuitBreakers(
+        window=BREAKER_WINDOW,
+        min_calls=BREAKER_MIN_CALLS,
+        error_rate=BREAKER_ERROR_RATE,
+        slow_call=BREAKER_SLOW_CALL,
+        slow_rate=BREAKER_SLOW_RATE,
+        open_for=BREAKER_OPEN_FOR,
+    )
+    metrics.registry.gauge("karapoke_spotify_breakers_open",
+                           "Spotify endpoints whose circuit breaker is open or half-open.", lambda: breakers.open_count())
+
+spotify_clients = SpotifyClientFactory(
+    client_id=CLIENT_ID,
+    client_secret=CLIENT_SECRET,
+    redirect_uri=REDIRECT_URI,
+    scope=SCOPE,
+    pool_size=SPOTIFY_POOL_SIZE,
+    timeout=SPOTIFY_TIMEOUT,
+    retries=SPOTIFY_RETRIES,
+    backoff=SPOTIFY_BACKOFF,
+    retry_after_max=SPOTIFY_RETRY_AFTER_MAX,
+    api_base=SPOTIFY_API_BASE,
+    governor=governor,
+    breakers=breakers,
+)
+
+# Spotify が不調の間に返す「最後に取れた結果」（ユーザー / market ごと）
+last_good = LastKnownGood(breakers=breakers, maxsize=LAST_GOOD_SIZE, ttl=LAST_GOOD_TTL)
+
+# 検索結果・カテゴリ一覧と、使えなかったプレイリスト（403/404/空）は全ユーザーで共有
+query_cache = QueryCache(maxsize=DISCOVERY_CACHE_SIZE, ttl=DISCOVERY_CACHE_TTL)
+dead_playlists = DeadPlaylists(base=DEAD_PLAYLIST_BACKOFF, max_backoff=DEAD_PLAYLIST_MAX_BACKOFF)
+
+# プレイリストはユーザー間で共有してキャッシュする
+playlist_cache = PlaylistCache(maxsize=PLAYLIST_CACHE_SIZE, ttl=PLAYLIST_CACHE_TTL, dead=dead_playlists,
+                               usable=lambda pl: bool(_extract_tracks((pl.get("tracks") or {}).get("items", []))))
+profile_cache = LRUTTLCache(maxsize=PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL, name="profiles")
+_profile_flight = SingleFlight()
+fanout = FanOut(max_workers=FANOUT_WORKERS)
+# ダッシュボードのうち自前で fanout に投げるセクションはこちらで動かす
+# （fanout のワーカーが fanout を待つと混雑時に詰まるため、プールを分ける）
+dashboard_sections = FanOut(max_workers=DASHBOARD_WORKERS, name="dashboard")
+track_store = TrackStore(path=TRACK_STORE_PATH, maxsize=TRACK_STORE_SIZE)
+recommender = Recommender()
+candidate_pool = CandidatePool(ttl=CANDIDATE_POOL_TTL, max_tracks_per_source=CANDIDATE_POOL_MAX_PER_SOURCE,
+                               dead=dead_playlists, track_store=track_store)
+feature_store = FeatureStore(path=AUDIO_FEATURES_PATH, maxsize=AUDIO_FEATURES_SIZE, on_add=recommender.add)
+liked_snapshots = LikedSnapshots(path=LIKED_SNAPSHOT_PATH)
+play_log = PlayLog(path=PLAY_LOG_PATH, sync_interval=PLAY_LOG_SYNC_INTERVAL)
+prefetch_jobs = PrefetchJobs(ttl=PREFETCH_TTL)
+token_manager = TokenManager(
+    spotify_clients.oauth,
+    margin=TOKEN_REFRESH_MARGIN,
+    ahead=TOKEN_REFRESH_AHEAD,
+)
+source_index = SourceIndex(path=SOURCE_INDEX_PATH, max_age=SOURCE_INDEX_MAX_AGE,
+                           query_cache=query_cache, dead=dead_playlists)
+
+def snapshot_sections():
+    # ユーザーに紐づかない共有キャッシュだけ（プロフィール・再生ログ・last known good は含めない）
+    return {
+        "playlists": playlist_cache,
+        "discovery": query_cache,
+        "dead_playlists": dead_playlists,
+        "tracks": track_store,
+        "audio_features": feature_store,
+        "sources": source_index,
+        "candidate_pool": candidate_pool,
+    }
+
+# 起動時（リクエストを受け付ける前）に前回のスナップショットを読み戻す
+snapshots = Snapshots(SNAPSHOT_PATH, snapshot_sections(), interval=SNAPSHOT_INTERVAL, max_age=SNAPSHOT_MAX_AGE)
+snapshots.restore()
+
 # ----------------------------------------------------------------------------
 # Helpers
 # ----------------------------------------------------------------------------
 def _oauth():
-    return SpotifyOAuth(
-        client_id=CLIENT_ID,
-        client_secret=CLIENT_SECRET,
-        redirect_uri=REDIRECT_URI,
-        scope=SCOPE,
-        cache_handler=MemoryCacheHandler(),
-        show_dialog=True,  # アカウント選択を毎回出す
-    )
+    return spotify_clients.oauth()
 
 def _ensure_token():
     token_info = session.get("token_info")
     if not token_info:
         return None
 
-    now = int(time.time())
-    if token_info.get("expires_at") and token_info["expires_at"] - now < 60:
-        try:
-            oauth = _oauth()
-            token_info = oauth.refresh_access_token(token_info["refresh_token"])
-            session["token_info"] = token_info
-            print("[AUTH] token refreshed")
-        except Exception as e:
-            print("[AUTH] refresh failed -> clear session:", e)
-            session.clear()
-            return None
-    return token_info
+    try:
+        fresh = token_manager.ensure(token_info)
+    except Exception as e:
+        print("[AUTH] refresh failed -> clear session:", e)
+        session.clear()
+        return None
+    if fresh != token_info:
+        session["token_info"] = fresh
+    return fresh
 
 def _spotify():
     token_info = _ensure_token()
     if not token_info:
         return None
-    return spotipy.Spotify(auth=token_info["access_token"])
+    return spotify_clients.client(token_info["access_token"])
+
+def _app_spotify():
+    # ユーザーに紐づかないバックグラウンド処理用（Client Credentials）
+    return spotify_clients.app_client()
+
+_background_started = False
+
+@app.before_request
+def _start_background_jobs():
+    global _background_started
+    if _background_started:
+        return
+    _background_started = True
+    source_index.start_refresher(_app_spotify, fanout, interval=SOURCE_INDEX_REFRESH_INTERVAL)
+    token_manager.start(interval=TOKEN_REFRESH_INTERVAL)
+    snapshots.start()
+
+def shutdown_background_jobs():
+    # ワーカー終了時（gunicorn の worker_exit）に状態を書き出して後片付け
+    source_index.save()
+    snapshots.save()
+    fanout.shutdown(wait=False)
+
+def _profile_key(token_info=None):
+    uid = session.get("user_id")
+    if uid:
+        return uid
+    token_info = token_info or session.get("token_info") or {}
+    at = token_info.get("access_token") or ""
+    return "at:" + hashlib.sha1(at.encode("utf-8")).hexdigest()[:16]
+
+def _current_user(sp, fresh=False, key=None):
+    # /me はキャッシュ優先（ログイン時に格納、TTL切れで取り直す）
+    key = key or _profile_key()
+    if not fresh:
+        user = profile_cache.get(key)
+        if user is not None:
+            return user
+
+    def load():
+        user = sp.current_user() or {}
+        profile_cache.set(key, user)
+        return user
+    return _profile_flight.do(key, load)
+
+def _user_or_stale(sp):
+    # Spotify が落ちていてプロフィールの TTL も切れていたら、最後に取れたものを返す -> (user, stale)
+    key = _profile_key()
+    return last_good.call(("me", key), lambda: _current_user(sp, key=key))
+
+def _user_market(sp, default=None):
+    try:
+        return (_user_or_stale(sp)[0] or {}).get("country") or default
+    except Exception:
+        return default
+
+# リクエストごとのレイテンシと Spotify 呼び出し回数を記録する
+@app.before_request
+def _metrics_start():
+    g.metrics_token = metrics.current_request.set(metrics.RequestStats())
+
+@app.after_request
+def _metrics_finish(response):
+    stats = metrics.current_request.get()
+    if stats is None:
+        return response
+    total = time.perf_counter() - stats.started
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.http_latency.observe(total, route, request.method, str(response.status_code))
+    metrics.upstream_per_request.observe(len(stats.calls), route)
+    if METRICS_SERVER_TIMING:
+        response.headers["Server-Timing"] = metrics.server_timing(stats, total)
+    return response
+
+@app.teardown_request
+def _metrics_reset(exc=None):
+    token = g.pop("metrics_token", None)
+    if token is not None:
+        metrics.current_request.reset(token)
 
 def _require_auth():
     if not _ensure_token():
         return jsonify({"error": "unauthorized"}), 401
     return None
 
+def _compact_requested():
+    # ?compact=1 で UI が使うフィールドだけに絞る
+    return request.args.get("compact", "").lower() in ("1", "true")
+
+def _int_arg(name, default, lo=1, hi=50):
+    try:
+        return max(lo, min(hi, int(request.args.get(name, default))))
+    except (TypeError, ValueError):
+        return default
+
+def _track_view(tracks):
+    return [compact_track(t) for t in tracks] if _compact_requested() else tracks
+
+def _conditional_json(payload):
+    # 内容が変わっていなければ If-None-Match に 304 を返す
+    resp = jsonify(payload)
+    resp.add_etag()
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp.make_conditional(request)
+
 # 最近のおすすめ履歴（セッション保持）
-RECENT_RECS_MAX = 5
+RECENT_RECS_MAX = int(os.environ.get("RECENT_RECS_MAX", "5"))
 
 def _save_recent_recs(track_ids):
     try:
@@ -139,7 +460,18 @@ def ping():
 
 @app.route(f"{API_PREFIX}/health")
 def health():
-    return jsonify({"status": "ok"})
+    out = {"status": "ok"}
+    if governor is not None:
+        out["spotify_rate"] = governor.stats()
+    if breakers is not None:
+        out["breakers"] = breakers.stats()
+        if out["breakers"]:
+            out["status"] = "degraded"
+    return jsonify(out)
+
+@app.route(f"{API_PREFIX}/_metrics")
+def metrics_endpoint():
+    return Response(metrics.registry.render(), mimetype="text/plain; version=0.0.4")
 
 @app.route(f"{API_PREFIX}/_routes")
 def list_routes():
@@ -170,17 +502,21 @@ def auth_callback():
 
     code = request.args.get("code")
     oauth = _oauth()
-    token_info = oauth.get_access_token(code, as_dict=True)
+    token_info = oauth.get_access_token(code, as_dict=True, check_cache=False)
 
     # トークンをセッションに保存
     session["token_info"] = token_info
 
     # ★この時点でユーザーIDを確定してセッションに保存
     try:
-        sp = spotipy.Spotify(auth=token_info["access_token"])
+        sp = spotify_clients.client(token_info["access_token"])
         me = sp.current_user()
         session["user_id"] = me.get("id")
+        if me.get("id"):
+            profile_cache.set(me["id"], me)
         print("[AUTH] logged in as:", me.get("id"), me.get("display_name"))
+        if PREFETCH_ON_LOGIN and me.get("id"):
+            _start_prefetch(sp, me)
     except Exception as e:
         session["user_id"] = None
         print("[AUTH] failed to fetch /me:", e)
@@ -188,12 +524,53 @@ def auth_callback():
     # フロントへ戻す（複数オリジンのときも先頭1つへ）
     return redirect(f"{FRONTEND_PRIMARY}/", code=302)
 
+def _start_prefetch(sp, me):
+    # 最初の画面で使うものを裏で温めておく（リダイレクトは待たせない）
+    user_id = me["id"]
+    market = me.get("country")
+
+    def recently_played(_):
+        _sync_plays(sp, user_id)
+        return [tid for _, tid in play_log.recent(user_id, 50)]
+
+    def liked(_):
+        page = fetch_first_page(sp)
+        track_store.add_tracks([it.get("track") for it in page.get("items", []) if it.get("track")])
+        return page
+
+    def recommendations(_):
+        return _pick_recommendations(sp, market, user_id=user_id)
+
+    def features(results):
+        ids = list(results.get("recently_played") or [])
+        ids += [(it.get("track") or {}).get("id") for it in (results.get("liked") or {}).get("items", [])]
+        ids += [t.get("id") for t in results.get("recommendations") or []]
+        return feature_store.fetch(sp, [tid for tid in ids if tid], fanout)
+
+    prefetch_jobs.start(user_id, [
+        {"recently_played": recently_played, "liked": liked, "recommendations": recommendations},
+        {"features": features},
+    ])
+
 @app.route(f"{API_PREFIX}/auth/logout", methods=["POST"])
 def auth_logout():
+    prefetch_jobs.forget(session.get("user_id"))
+    profile_cache.pop(_profile_key())
+    token_manager.forget((session.get("token_info") or {}).get("refresh_token"))
     session.clear()
     return jsonify({"ok": True})
 
 # -------- API: me / recently played / audio features / recommendations --------
+def _me_payload(user):
+    return {
+        "id": user.get("id"),
+        "display_name": user.get("display_name"),
+        "country": user.get("country"),
+        "product": user.get("product"),
+        "images": user.get("images", []),
+        "external_urls": user.get("external_urls", {}),
+    }
+
 @app.route(f"{API_PREFIX}/me")
 def me():
     need = _require_auth()
@@ -202,18 +579,35 @@ def me():
     if sp is None:
         return jsonify({"error": "unauthorized"}), 401
     try:
-        user = sp.current_user()
-        return jsonify({
-            "id": user.get("id"),
-            "display_name": user.get("display_name"),
-            "country": user.get("country"),
-            "product": user.get("product"),
-            "images": user.get("images", []),
-            "external_urls": user.get("external_urls", {}),
-        })
+        user, stale = _user_or_stale(sp)
+        payload = _me_payload(user)
+        if stale:
+            payload["stale"] = True
+        return jsonify(payload)
     except Exception as e:
         return jsonify({"error": "failed_to_fetch_user", "details": str(e)}), 500
 
+def _sync_plays(sp, user_id):
+    # 前回の played_at 以降だけを取りに行き、ローカルの再生ログに追記
+    try:
+        track_store.add_tracks(play_log.sync(sp, user_id))
+    except Exception as e:
+        if not play_log.count(user_id):
+            raise
+        print("[PLAYS] sync failed, serving local log:", e)
+
+def _load_recently_played(sp, user_id, limit):
+    if not user_id:
+        rp = sp.current_user_recently_played(limit=limit)
+        tracks = [it.get("track") for it in rp.get("items", []) if it.get("track")]
+        track_store.add_tracks(tracks)
+        return tracks
+    prefetch_jobs.wait(user_id, "recently_played", PREFETCH_WAIT)
+    _sync_plays(sp, user_id)
+    plays = play_log.recent(user_id, limit)
+    by_id = track_store.hydrate(sp, [tid for _, tid in plays], fanout)
+    return [by_id[tid] for _, tid in plays if tid in by_id]
+
 @app.route(f"{API_PREFIX}/recently-played")
 def recently_played():
     need = _require_auth()
@@ -223,12 +617,56 @@ def recently_played():
         return jsonify({"error": "unauthorized"}), 401
     try:
         limit = int(request.args.get("limit", 20))
-        rp = sp.current_user_recently_played(limit=limit)
-        tracks = [it.get("track") for it in rp.get("items", []) if it.get("track")]
-        return jsonify({"items": tracks})
+        user_id = session.get("user_id")
+        tracks, stale = last_good.call(("recently_played", user_id or _profile_key(), limit),
+                                       lambda: _load_recently_played(sp, user_id, limit))
+        payload = {"items": _track_view(tracks)}
+        if stale:
+            payload["stale"] = True
+        return _conditional_json(payload)
     except Exception as e:
         return jsonify({"error": "failed_to_fetch_recently_played", "details": str(e)}), 500
 
+# -------- API: play history (served from the local play log) --------
+@app.route(f"{API_PREFIX}/history/top")
+def history_top():
+    need = _require_auth()
+    if need: return need
+    user_id = session.get("user_id")
+    sp = _spotify()
+    if sp is None or not user_id:
+        return jsonify({"error": "unauthorized"}), 401
+    days = _int_arg("days", 30, hi=3650)
+    limit = _int_arg("limit", 20)
+    try:
+        _sync_plays(sp, user_id)
+        since_ms = int((time.time() - days * 86400) * 1000)
+        rows = play_log.top(user_id, since_ms, limit)
+        by_id = track_store.hydrate(sp, [tid for tid, _, _ in rows], fanout)
+        view = compact_track if _compact_requested() else (lambda t: t)
+        items = [
+            {"track": view(by_id[tid]), "plays": n, "last_played_at": iso_from_ms(last)}
+            for tid, n, last in rows if tid in by_id
+        ]
+        return _conditional_json({"items": items, "days": days})
+    except Exception as e:
+        return jsonify({"error": "failed_to_fetch_history", "details": str(e)}), 500
+
+def _load_liked(sp, limit, offset, user_id=None):
+    res = None
+    if offset == 0 and limit <= LIKED_PAGE_SIZE:
+        res = prefetch_jobs.wait(user_id, "liked", PREFETCH_WAIT)
+    if res is None:
+        res = sp.current_user_saved_tracks(limit=limit, offset=offset)
+    items = res.get("items", [])[:limit]
+    tracks = [it.get("track") for it in items if it.get("track")]
+    track_store.add_tracks(tracks)
+    return tracks, res.get("total")
+
+def _is_scope_error(se):
+    msg = str(se)
+    return getattr(se, "http_status", None) == 403 or bool(msg and "Insufficient client scope" in msg)
+
 @app.route(f"{API_PREFIX}/liked-tracks")
 def liked_tracks():
     need = _require_auth()
@@ -239,13 +677,16 @@ def liked_tracks():
     try:
         limit = int(request.args.get("limit", 20))
         offset = int(request.args.get("offset", 0))
-        res = sp.current_user_saved_tracks(limit=limit, offset=offset)
-        items = res.get("items", [])
-        tracks = [it.get("track") for it in items if it.get("track")]
-        return jsonify({"items": tracks, "total": res.get("total")})
+        user_id = session.get("user_id")
+        (tracks, total), stale = last_good.call(("liked", user_id or _profile_key(), limit, offset),
+                                                lambda: _load_liked(sp, limit, offset, user_id))
+        payload = {"items": _track_view(tracks), "total": total}
+        if stale:
+            payload["stale"] = True
+        return _conditional_json(payload)
     except SpotifyException as se:
         msg = str(se)
-        if getattr(se, "http_status", None) == 403 or (msg and "Insufficient client scope" in msg):
+        if _is_scope_error(se):
             return jsonify({
                 "error": "insufficient_scope",
                 "details": "user-library-read scope required. Please logout and login again.",
@@ -254,6 +695,33 @@ def liked_tracks():
     except Exception as e:
         return jsonify({"error": "failed_to_fetch_liked_tracks", "details": str(e)}), 500
 
+@app.route(f"{API_PREFIX}/liked-tracks/export")
+def liked_tracks_export():
+    need = _require_auth()
+    if need: return need
+    sp = _spotify()
+    if sp is None:
+        return jsonify({"error": "unauthorized"}), 401
+    try:
+        # 1ページ目で total を確定してからストリームを開始する（ログイン直後なら先読み分を使う）
+        first_page = prefetch_jobs.wait(session.get("user_id"), "liked", PREFETCH_WAIT) or fetch_first_page(sp)
+    except SpotifyException as se:
+        msg = str(se)
+        if _is_scope_error(se):
+            return jsonify({
+                "error": "insufficient_scope",
+                "details": "user-library-read scope required. Please logout and login again.",
+            }), 403
+        return jsonify({"error": "failed_to_fetch_liked_tracks", "details": msg}), 500
+    except Exception as e:
+        return jsonify({"error": "failed_to_fetch_liked_tracks", "details": str(e)}), 500
+    lines = stream_export(
+        sp, first_page, session.get("user_id"), liked_snapshots, track_store, fanout,
+        concurrency=LIKED_EXPORT_CONCURRENCY,
+        full=request.args.get("full") in ("1", "true"),
+    )
+    return Response(stream_with_context(lines), mimetype="application/x-ndjson")
+
 @app.route(f"{API_PREFIX}/audio-features")
 def audio_features():
     need = _require_auth()
@@ -266,14 +734,232 @@ def audio_features():
     if sp is None:
         return jsonify({"audio_features": []})
     try:
-        feats = sp.audio_features(ids_list) or []
-        for f in feats:
-            if f and "id" not in f:
-                f["id"] = None
+        by_id = feature_store.fetch(sp, ids_list, fanout)
+        feats = [by_id.get(tid) for tid in ids_list]
         return jsonify({"audio_features": feats})
     except Exception as e:
         return jsonify({"error": "failed_to_fetch_audio_features", "details": str(e)}), 500
 
+@app.route(f"{API_PREFIX}/singability", methods=["GET", "POST"])
+def singability():
+    need = _require_auth()
+    if need: return need
+    # 大量のIDはクエリ長を超えるので POST {"ids": [...]} も受け付ける
+    if request.method == "POST":
+        ids_list = (request.get_json(silent=True) or {}).get("ids") or []
+    else:
+        ids_list = request.args.get("ids", "").split(",")
+    ids_list = list(dict.fromkeys(x.strip() for x in ids_list if isinstance(x, str) and x.strip()))
+    if not ids_list:
+        return jsonify({"scores": []})
+    if len(ids_list) > SINGABILITY_MAX_IDS:
+        return jsonify({"error": "too_many_ids", "max": SINGABILITY_MAX_IDS}), 400
+    sp = _spotify()
+    if sp is None:
+        return jsonify({"error": "unauthorized"}), 401
+    try:
+        by_id = feature_store.fetch(sp, ids_list, fanout)
+        scores = singability_scores([by_id.get(tid) for tid in ids_list])
+        return jsonify({"scores": scores})
+    except Exception as e:
+        return jsonify({"error": "failed_to_score_singability", "details": str(e)}), 500
+
+# -------- Recommendation helpers --------
+def _extract_tracks(items):
+    return [
+        it.get("track") for it in (items or [])
+        if it.get("track") and it["track"].get("id") and not it["track"].get("is_local")
+    ]
+
+def _try_fetch_playlist(sp, pid, market=None):
+    try:
+        pl = playlist_cache.get(sp, pid, market=market)
+    except Exception:
+        return []
+    if pl is None:
+        return []
+    # 空だった場合の dead への記録は PlaylistCache が取得時に行う
+    return _extract_tracks((pl.get("tracks") or {}).get("items", []))
+
+def _is_spotify_owner(pl):
+    owner = (pl or {}).get("owner") or {}
+    name = (owner.get("display_name") or owner.get("id") or "").lower()
+    return "spotify" in name
+
+FALLBACK_QUERIES = [
+    # New Music Friday variants
+    "New Music Friday",
+    "New Music Friday Japan",
+    "New Music Friday – Japan",
+    "New Music Friday — Japan",
+    "ニュー・ミュージック・フライデー",
+    # Fallbacks that often exist globally
+    "Today's Top Hits",
+    "Today’s Top Hits",
+    "Top Hits",
+    "今日のトップヒッツ",
+]
+
+def _fallback_tracks(sp, market):
+    deadline = time.monotonic() + RECS_FALLBACK_DEADLINE
+
+    def search(q):
+        res = query_cache.search(sp, q, type="playlist", limit=10)
+        return [p for p in (res.get("playlists") or {}).get("items", []) if p]
+
+    def toplists():
+        cat = query_cache.category_playlists(sp, "toplists", country=market, limit=20)
+        return [p for p in (cat.get("playlists") or {}).get("items", []) if p]
+
+    # Stage 1: all searches (and the toplists listing) go out at once
+    search_futs = [fanout.submit(search, q) for q in FALLBACK_QUERIES]
+    cat_fut = fanout.submit(toplists) if market else None
+
+    # Stage 2: start fetching candidates as soon as each search resolves,
+    # keeping the original priority order (query order, Spotify-owned first)
+    seen = set()
+    fetch_futs = []
+    for f in search_futs:
+        pls = wait_result(f, deadline, default=[])
+        spotify_owned = [p for p in pls if _is_spotify_owner(p)]
+        others = [p for p in pls if not _is_spotify_owner(p)]
+        for p in spotify_owned + others:
+            pid = p.get("id")
+            if not pid or pid in seen or len(fetch_futs) >= RECS_FALLBACK_MAX_CANDIDATES:
+                continue
+            seen.add(pid)
+            fetch_futs.append(fanout.submit(_try_fetch_playlist, sp, pid, market))
+    tracks = first_in_order(fetch_futs, deadline) or []
+    if tracks or cat_fut is None:
+        if cat_fut is not None:
+            cat_fut.cancel()
+        return tracks
+
+    # 3) Fallback to toplists category for user's market
+    pls = wait_result(cat_fut, deadline, default=[])
+    # Prefer names that look like Top Hits, Spotify-owned
+    prefer = []
+    for p in pls:
+        name = (p.get("name") or "").lower()
+        score = 0
+        if "top" in name and "hit" in name:
+            score += 2
+        if _is_spotify_owner(p):
+            score += 1
+        prefer.append((score, p))
+    fetch_futs = []
+    for _, p in sorted(prefer, key=lambda x: -x[0]):
+        pid = p.get("id")
+        if not pid or pid in seen:
+            continue
+        seen.add(pid)
+        fetch_futs.append(fanout.submit(_try_fetch_playlist, sp, pid, market))
+    return first_in_order(fetch_futs, deadline) or []
+
+def _rank_local(sp, user_id, cand_ids, n):
+    # 最近再生 + お気に入りをシードに、候補をローカルの特徴量行列で並べる
+    try:
+        _sync_plays(sp, user_id)
+    except Exception:
+        pass
+    seeds = [tid for _, tid in play_log.recent(user_id, RECS_SEED_RECENT)]
+    snap = liked_snapshots.get(user_id)
+    if snap:
+        seeds += [tid for _, tid in snap["items"][:RECS_SEED_LIKED]]
+    if not seeds:
+        return []
+    by_id = feature_store.fetch(sp, seeds + cand_ids, fanout)
+    recommender.add(list(by_id.values()))  # ディスクから読んだ分も行列へ
+    return recommender.rank(seeds, cand_ids, k=n)
+
+def _choose(sp, user_id, cand_ids, n):
+    # 履歴があればローカル推薦で上位 n 件、なければ先頭 n 件（候補はランダム順）
+    if RECS_LOCAL and user_id and cand_ids:
+        try:
+            ranked = _rank_local(sp, user_id, cand_ids, n)
+        except Exception as e:
+            print("[RECS] local ranking failed, falling back to random:", e)
+            ranked = []
+        if ranked:
+            return ranked
+    return cand_ids[:n]
+
+_pool_loading = set()
+_pool_loading_lock = threading.Lock()
+
+def _load_pool_async(sp, tag, keys):
+    # 未読み込み・TTL切れのソースだけを裏で全ページ読み込む（読み終わるまでは今ある版を使う）
+    keys = [k for k in keys if not candidate_pool.fresh(*k)]
+    if not keys:
+        return
+    with _pool_loading_lock:
+        if tag in _pool_loading:
+            return
+        _pool_loading.add(tag)
+
+    def run():
+        try:
+            with background():
+                for pid, market in keys:
+                    try:
+                        candidate_pool.load(_app_spotify() or sp, pid, fanout, market=market)
+                    except Exception as e:
+                        print("[POOL] failed to load source:", pid, e)
+        finally:
+            with _pool_loading_lock:
+                _pool_loading.discard(tag)
+
+    threading.Thread(target=run, name=f"pool-{tag}", daemon=True).start()
+
+def _extend_pool_async(sp, market):
+    # ソースインデックスにあるプレイリストは裏で全ページ読み込んでプールに足す
+    pids = [e["id"] for e in (source_index.get(market) or [])[:CANDIDATE_POOL_SOURCES]]
+    if pids:
+        _load_pool_async(sp, market, [(pid, market) for pid in pids])
+
+def _pool_keys(market):
+    keys = [(RECOMMENDATION_PLAYLIST_ID, None)]
+    if market:
+        keys += [(e["id"], market) for e in (source_index.get(market) or [])[:CANDIDATE_POOL_SOURCES]]
+    return [k for k in keys if candidate_pool.loaded(*k)]
+
+def _pick_recommendations(sp, market, n=10, user_id=None):
+    # 1) 候補プール: 固定プレイリスト(RECOMMENDATION_PLAYLIST_ID)の全ページ + ソースインデックスのプレイリスト
+    # 固定プレイリストはまだ無いときだけその場で読み、TTL切れの読み直しは裏に回す
+    # （期限が切れた瞬間に全リクエストが全ページの再取得を待たないように）
+    if candidate_pool.loaded(RECOMMENDATION_PLAYLIST_ID):
+        _load_pool_async(sp, "primary", [(RECOMMENDATION_PLAYLIST_ID, None)])
+    else:
+        try:
+            candidate_pool.load(sp, RECOMMENDATION_PLAYLIST_ID, fanout)
+        except Exception as e:
+            print("[POOL] failed to load primary playlist:", e)
+    _extend_pool_async(sp, market)
+    keys = _pool_keys(market)
+    if keys:
+        cand_ids = candidate_pool.sample(keys, RECS_RANK_CANDIDATES if (RECS_LOCAL and user_id) else n)
+        ids = _choose(sp, user_id, cand_ids, n)
+        by_id = track_store.hydrate(sp, ids, fanout)
+        tracks = [by_id[tid] for tid in ids if tid in by_id]
+        if tracks:
+            return tracks
+
+    # 2) Fallback: 固定プレイリストを market 付きで、だめなら search + toplists を並列パイプラインで
+    tracks = _try_fetch_playlist(sp, RECOMMENDATION_PLAYLIST_ID, market=market) if market else []
+    if not tracks:
+        tracks = _fallback_tracks(sp, market)
+    track_store.add_tracks(tracks)
+    random.shuffle(tracks)
+    by_id = {t["id"]: t for t in tracks}
+    return [by_id[tid] for tid in _choose(sp, user_id, list(by_id), n)]
+
+def _recommendations_for(sp, market, user_id):
+    # ログイン直後の先読み分があれば最初の1回はそれを使う
+    tracks = prefetch_jobs.take(user_id, "recommendations", PREFETCH_WAIT)
+    if tracks:
+        return tracks
+    return _pick_recommendations(sp, market, user_id=user_id)
+
 @app.route(f"{API_PREFIX}/recommendations")
 def recommendations():
     need = _require_auth()
@@ -282,109 +968,11 @@ def recommendations():
     if sp is None:
         return jsonify({"error": "unauthorized"}), 401
     try:
-        # Primary: use RECOMMENDATION_PLAYLIST_ID; Fallbacks: search + toplists category
-        n = 10
-
-        def extract_tracks(items):
-            return [
-                it.get("track") for it in (items or [])
-                if it.get("track") and it["track"].get("id") and not it["track"].get("is_local")
-            ]
-
-        def try_fetch_playlist(pid, market=None):
-            try:
-                pl = sp.playlist(pid, market=market)
-                items_local = (pl.get("tracks") or {}).get("items", [])
-                return extract_tracks(items_local)
-            except Exception:
-                return []
-
-        def is_spotify_owner(pl):
-            owner = (pl or {}).get("owner") or {}
-            name = (owner.get("display_name") or owner.get("id") or "").lower()
-            return "spotify" in name
-
         # Determine user market (best effort)
-        try:
-            user = sp.current_user()
-            market = (user or {}).get("country") or None
-        except Exception:
-            market = None
-
-        tracks = []
-        # 1) Fixed playlist id first (no market, then with market)
-        tracks = try_fetch_playlist(RECOMMENDATION_PLAYLIST_ID, market=None)
-        if not tracks and market:
-            tracks = try_fetch_playlist(RECOMMENDATION_PLAYLIST_ID, market=market)
-
-        # 2) Search by common names if still empty
-        if not tracks:
-            queries = [
-                # New Music Friday variants
-                "New Music Friday",
-                "New Music Friday Japan",
-                "New Music Friday – Japan",
-                "New Music Friday — Japan",
-                "ニュー・ミュージック・フライデー",
-                # Fallbacks that often exist globally
-                "Today's Top Hits",
-                "Today’s Top Hits",
-                "Top Hits",
-                "今日のトップヒッツ",
-            ]
-            candidates = []
-            for q in queries:
-                try:
-                    res = sp.search(q=q, type="playlist", limit=10) or {}
-                    pls = (res.get("playlists") or {}).get("items", [])
-                    # prioritize Spotify-owned first, then others
-                    spotify_owned = [p for p in pls if is_spotify_owner(p)]
-                    others = [p for p in pls if not is_spotify_owner(p)]
-                    candidates.extend(spotify_owned + others)
-                except Exception:
-                    continue
-            # Try each candidate until tracks found
-            for p in candidates:
-                pid = p.get("id")
-                if not pid:
-                    continue
-                tracks = try_fetch_playlist(pid, market=market)
-                if tracks:
-                    break
-
-        # 3) Fallback to toplists category for user's market
-        if not tracks and market:
-            try:
-                cat = sp.category_playlists("toplists", country=market, limit=20) or {}
-                pls = (cat.get("playlists") or {}).get("items", [])
-                # Prefer names that look like Top Hits, Spotify-owned
-                prefer = []
-                for p in pls:
-                    name = (p.get("name") or "").lower()
-                    score = 0
-                    if "top" in name and "hit" in name:
-                        score += 2
-                    if is_spotify_owner(p):
-                        score += 1
-                    prefer.append((score, p))
-                for _, p in sorted(prefer, key=lambda x: -x[0]):
-                    pid = p.get("id")
-                    if not pid:
-                        continue
-                    tracks = try_fetch_playlist(pid, market=market)
-                    if tracks:
-                        break
-            except Exception:
-                pass
-
-        # Limit to n tracks
-        if len(tracks) > n:
-            try:
-                tracks = random.sample(tracks, n)
-            except Exception:
-                tracks = tracks[:n]
-        else:
-            tracks = tracks[:n]
+        market = _user_market(sp)
+        user_id = session.get("user_id")
+        tracks, stale = last_good.call(("recommendations", user_id or market),
+                                       lambda: _recommendations_for(sp, market, user_id), valid=bool)
 
         # Save snapshot (best-effort)
         try:
@@ -393,31 +981,24 @@ def recommendations():
         except Exception:
             pass
 
-        return jsonify({"tracks": tracks})
+        payload = {"tracks": _track_view(tracks)}
+        if stale:
+            payload["stale"] = True
+        return jsonify(payload)
     except Exception as e:
         # Never 500 for UI: fail safe with empty list
         return jsonify({"tracks": []})
 
 # -------- API: recent recommendations history --------
-@app.route(f"{API_PREFIX}/recommendations/recent")
-def recommendations_recent():
-    need = _require_auth()
-    if need: return need
-    entries = _get_recent_recs()
-    if not entries:
-        return jsonify({"entries": []})
-    sp = _spotify()
+def _hydrate_recent(sp, entries):
     out = []
     tracks_by_id = {}
     try:
         all_ids = []
         for e in entries:
             all_ids.extend([tid for tid in e.get("track_ids", []) if tid])
-        for i in range(0, len(all_ids), 50):
-            resp = sp.tracks(all_ids[i:i+50]) if sp else {"tracks": []}
-            for t in (resp.get("tracks") or []):
-                if t and t.get("id"):
-                    tracks_by_id[t["id"]] = t
+        # ストアから読み、無い分だけまとめて取得
+        tracks_by_id = track_store.hydrate(sp, all_ids, fanout)
     except Exception:
         tracks_by_id = {}
     for e in entries:
@@ -425,7 +1006,125 @@ def recommendations_recent():
         ts = e.get("ts")
         t_objs = [tracks_by_id.get(tid) for tid in tids if tracks_by_id.get(tid)]
         out.append({"ts": ts, "track_ids": tids, "tracks": t_objs})
-    return jsonify({"entries": out})
+    return out
+
+@app.route(f"{API_PREFIX}/recommendations/recent")
+def recommendations_recent():
+    need = _require_auth()
+    if need: return need
+    entries = _get_recent_recs()
+    if not entries:
+        return jsonify({"entries": []})
+    sp = _spotify()
+    out = _hydrate_recent(sp, entries)
+    for e in out:
+        e["tracks"] = _track_view(e["tracks"])
+    return _conditional_json({"entries": out})
+
+# -------- API: dashboard (one round trip for the main pages) --------
+DASHBOARD_FIELDS = ("me", "recently_played", "recommendations", "recent", "liked", "audio_features")
+
+@app.route(f"{API_PREFIX}/dashboard")
+def dashboard():
+    need = _require_auth()
+    if need: return need
+    sp = _spotify()
+    if sp is None:
+        return jsonify({"error": "unauthorized"}), 401
+    fields = request.args.get("fields")
+    wanted = [f.strip() for f in fields.split(",")] if fields else list(DASHBOARD_FIELDS)
+    unknown = [f for f in wanted if f not in DASHBOARD_FIELDS]
+    if unknown:
+        return jsonify({"error": "unknown_fields", "fields": unknown, "allowed": list(DASHBOARD_FIELDS)}), 400
+
+    out = {"tracks": {}, "errors": {}, "stale": []}
+    tracks = out["tracks"]
+    view = compact_track if _compact_requested() else (lambda t: t)
+
+    def keep(ts):
+        # 曲本体は tracks にまとめ、各セクションはIDだけを持つ
+        ids = []
+        for t in ts or []:
+            tid = (t or {}).get("id")
+            if tid and tid not in ids:
+                tracks.setdefault(tid, view(t))
+                ids.append(tid)
+        return ids
+
+    # セッションに触る部分はリクエストスレッドで済ませる
+    user = None
+    if "me" in wanted or "recommendations" in wanted:
+        try:
+            user, stale = _user_or_stale(sp)
+            if stale and "me" in wanted:
+                out["stale"].append("me")
+        except Exception as e:
+            out["errors"]["me"] = str(e)
+    if "me" in wanted and user is not None:
+        out["me"] = _me_payload(user)
+    market = (user or {}).get("country")
+    entries = _get_recent_recs() if "recent" in wanted else []
+    user_id = session.get("user_id")
+    owner = user_id or _profile_key()
+
+    # セクションは並列に進め、全体で DASHBOARD_DEADLINE まで待つ。単発の呼び出し（liked）は fanout へ、
+    # 自前で fanout に投げるセクション（track_store.hydrate を使う recently_played / recommendations / recent）は
+    # dashboard_sections へ投げる
+    deadline = time.monotonic() + DASHBOARD_DEADLINE
+    # 各セクションは単独のルートと同じキーで last known good を共有する -> (結果, stale)
+    futs = {}
+    if "liked" in wanted:
+        liked_limit = _int_arg("liked_limit", 20)
+        liked_offset = _int_arg("liked_offset", 0, lo=0, hi=100000)
+        futs["liked"] = fanout.submit(
+            last_good.call, ("liked", owner, liked_limit, liked_offset),
+            lambda: _load_liked(sp, liked_limit, liked_offset, user_id))
+    if "recently_played" in wanted:
+        recent_limit = _int_arg("recent_limit", 12)
+        futs["recently_played"] = dashboard_sections.submit(
+            last_good.call, ("recently_played", owner, recent_limit),
+            lambda: _load_recently_played(sp, user_id, recent_limit))
+    if "recommendations" in wanted:
+        futs["recommendations"] = dashboard_sections.submit(
+            last_good.call, ("recommendations", user_id or market),
+            lambda: _recommendations_for(sp, market, user_id), valid=bool)
+    if "recent" in wanted:
+        futs["recent"] = dashboard_sections.submit(lambda: (_hydrate_recent(sp, entries) if entries else [], False))
+
+    for name in [f for f in DASHBOARD_FIELDS if f in futs]:
+        try:
+            res, stale = futs[name].result(timeout=remaining(deadline))
+        except SpotifyException as se:
+            out["errors"][name] = "insufficient_scope" if name == "liked" and _is_scope_error(se) else str(se)
+            continue
+        except Exception as e:
+            out["errors"][name] = str(e) or "timeout"
+            continue
+        if stale:
+            out["stale"].append(name)
+        if name == "liked":
+            liked, total = res
+            out["liked"] = {"ids": keep(liked), "total": total}
+        elif name == "recent":
+            for e in res:
+                keep(e["tracks"])
+            out["recent"] = [{"ts": e["ts"], "track_ids": e["track_ids"]} for e in res]
+        else:
+            out[name] = keep(res)
+
+    if "recommendations" in out:
+        try:
+            _save_recent_recs(out["recommendations"])
+        except Exception:
+            pass
+
+    if "audio_features" in wanted:
+        try:
+            by_id = feature_store.fetch(sp, list(tracks), fanout, timeout=remaining(deadline)) if tracks else {}
+            out["audio_features"] = {tid: f for tid, f in by_id.items() if f}
+        except Exception as e:
+            out["errors"]["audio_features"] = str(e)
+    return jsonify(out)
 
 @app.route(f"{API_PREFIX}/recommendations/recent", methods=["DELETE"])
 def recommendations_recent_clear():
@@ -441,67 +1140,16 @@ def recommendation_sources():
     if sp is None:
         return jsonify({"entries": []})
     try:
-        try:
-            user = sp.current_user()
-            market = (user or {}).get("country") or "JP"
-        except Exception:
-            market = "JP"
-
-        seen = set()
-        out = []
-
-        def try_add_playlist_basic(pl):
-            pid = (pl or {}).get("id")
-            if not pid or pid in seen:
-                return
-            try:
-                # Validate accessibility by fetching the playlist
-                pl_full = sp.playlist(pid)
-                tracks_total = (pl_full.get("tracks") or {}).get("total")
-                out.append({
-                    "id": pid,
-                    "name": pl.get("name"),
-                    "owner": ((pl.get("owner") or {}).get("display_name") or (pl.get("owner") or {}).get("id")),
-                    "tracks_total": tracks_total,
-                })
-                seen.add(pid)
-            except Exception:
-                # Skip inaccessible playlists
-                pass
-
-        # 1) Category 'toplists' for user's market
-        try:
-            cat = sp.category_playlists("toplists", country=market, limit=20) or {}
-            pls = (cat.get("playlists") or {}).get("items", [])
-            # Prefer Japan-related names first
-            preferred = [p for p in pls if isinstance(p.get("name"), str) and (
-                "Japan" in p["name"] or "日本" in p["name"] or "JP" in p["name"]
-            )]
-            for p in preferred + pls:
-                try_add_playlist_basic(p)
-        except Exception:
-            pass
+        market = _user_market(sp, default="JP")
 
-        # 2) Search common Japan editorial lists
-        queries = [
-            "Top 50 - Japan",
-            "Viral 50 - Japan",
-            "Hot Hits Japan",
-            "J-Pop Now",
-            "J-Rock Now",
-            "Tokyo Super Hits",
-            "New Music Friday Japan",
-        ]
-        for q in queries:
-            try:
-                res = sp.search(q=q, type="playlist", limit=5) or {}
-                playlists = (res.get("playlists") or {}).get("items", [])
-                for p in playlists:
-                    try_add_playlist_basic(p)
-            except Exception:
-                continue
+        # インデックスにあればそのまま返す（未知のマーケットのみライブで構築）
+        # 空でも built_at 付きで覚え、取り直しはリフレッシャーに任せる（毎リクエスト構築しない）
+        entries = source_index.get(market)
+        if entries is None:
+            entries = build_sources(sp, market, fanout, query_cache=query_cache, dead=dead_playlists)
+            source_index.put(market, entries)
 
-        return jsonify({"entries": out[:20], "market": market})
+        return jsonify({"entries": entries[:20], "market": market})
     except Exception as e:
         # Fail safe: return empty suggestions
         return jsonify({"entries": [], "market": None, "error": "failed_to_list_sources", "details": str(e)})
@@ -534,7 +1182,7 @@ def debug_me():
     if sp is None:
         return jsonify({"error": "unauthorized"}), 401
     try:
-        user = sp.current_user()
+        user = _current_user(sp, fresh=bool(request.args.get("fresh")))
         print("[DEBUG /me]", {
             "time": int(time.time()),
             "session_has_token": bool(session.get("token_info")),
@@ -564,7 +1212,7 @@ def debug_me_ids():
     sp = _spotify()
     if sp is None:
         return jsonify({"error": "unauthorized"}), 401
-    me = sp.current_user()
+    me = _current_user(sp, fresh=bool(request.args.get("fresh")))
     return jsonify({
         "session_user_id": session.get("user_id"),
         "live_me_id": me.get("id"),
@@ -572,8 +1220,6 @@ def debug_me_ids():
         "email": me.get("email"),
     })
 
-import hashlib
-
 @app.route(f"{API_PREFIX}/debug/token-fp")
 def debug_token_fp():
     ti = session.get("token_info")
@@ -0,0 +1,98 @@
+# server/audio_features.py
+# オーディオ特徴量の永続キャッシュと「歌いやすさ」スコア計算
+# 特徴量はトラックIDに対して不変なので、一度取れたら期限なしで保持する。
+# 取得中のIDは覚えておき、同じIDを求める他の呼び出し（ログイン直後の先読みなど）はその完了を待つ。
+import threading
+import time
+
+import numpy as np
+
+from kv_store import JsonStore
+
+FEATURES_BATCH = 100  # sp.audio_features() の上限
+
+# 歌いやすいテンポの中心と許容幅（フロントの buildSingabilityMap と同じ式）
+TARGET_BPM = 95.0
+BPM_WIDTH = 60.0
+
+
+class FeatureStore(JsonStore):
+    def __init__(self, path=None, maxsize=20000, on_add=None):
+        super().__init__("audio_features", path=path, maxsize=maxsize)
+        self.on_add = on_add  # 新しく取れた特徴量の通知先（推薦用の行列など）
+        self._inflight = {}  # id -> threading.Event（取得中の呼び出しが完了時に set する）
+        self._inflight_lock = threading.Lock()
+
+    def fetch(self, sp, ids, fanout, timeout=10):
+        """Return {id: features} for `ids`; only uncached ids go upstream.
+
+        Ids another caller is already fetching are not requested again: this
+        call waits for that fetch and reads them from the store afterwards.
+        """
+        ids = list(dict.fromkeys(tid for tid in ids if tid))
+        found = self.get_many(ids)
+        misses = [tid for tid in ids if tid not in found]
+        if not misses or sp is None:
+            return found
+        deadline = time.monotonic() + timeout
+        done = threading.Event()
+        with self._inflight_lock:
+            waiting = {tid: self._inflight[tid] for tid in misses if tid in self._inflight}
+            mine = [tid for tid in misses if tid not in waiting]
+            for tid in mine:
+                self._inflight[tid] = done
+        try:
+            found.update(self._fetch_upstream(sp, mine, fanout, deadline))
+        finally:
+            with self._inflight_lock:
+                for tid in mine:
+                    if self._inflight.get(tid) is done:
+                        del self._inflight[tid]
+            done.set()
+        if waiting:
+            for event in set(waiting.values()):
+                event.wait(max(0.0, deadline - time.monotonic()))
+            got = self.get_many(list(waiting))
+            # 相手の取得が失敗した / 間に合わなかった分は自分で取りに行く
+            left = [tid for tid in waiting if tid not in got]
+            if left and deadline > time.monotonic():
+                got.update(self._fetch_upstream(sp, left, fanout, deadline))
+            found.update(got)
+        return found
+
+    def _fetch_upstream(self, sp, ids, fanout, deadline):
+        if not ids:
+            return {}
+        futs = [
+            fanout.submit(sp.audio_features, ids[i:i + FEATURES_BATCH])
+            for i in range(0, len(ids), FEATURES_BATCH)
+        ]
+        fetched = {}
+        for f in futs:
+            for feat in f.result(timeout=max(0.0, deadline - time.monotonic())) or []:
+                if feat and feat.get("id"):
+                    fetched[feat["id"]] = feat
+        self.put_many(fetched)
+        if self.on_add is not None and fetched:
+            self.on_add(list(fetched.values()))
+        return fetched
+
+    def import_state(self, state):
+        count = super().import_state(state)
+        if self.on_add is not None and state:
+            self.on_add([v for _, v in state])
+        return count
+
+
+def singability_scores(features):
+    """Vectorized BPM score for a list of audio-feature dicts."""
+    features = [f for f in features if f and f.get("id")]
+    if not features:
+        return []
+    tempo = np.array([f.get("tempo") or 0.0 for f in features], dtype=np.float64)
+    score = np.clip(1.0 - np.abs(TARGET_BPM - tempo) / BPM_WIDTH, 0.0, None)
+    tempo_rounded = np.floor(tempo + 0.5).astype(np.int64)  # JS の Math.round と揃える
+    return [
+        {"id": f["id"], "tempo": int(t), "key": f.get("key"), "scorePartial": round(float(s), 4)}
+        for f, t, s in zip(features, tempo_rounded, score)
+    ]
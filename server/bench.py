@@ -0,0 +1,178 @@
+# server/bench.py
+# オフライン負荷テスト: ローカルの Spotify スタンドインに対して主要ルートを叩き、
+# スループット / p50・p95・p99 レイテンシ / 1リクエストあたりの上流呼び出し数を出す。
+#
+#   python bench.py --concurrency 1,8,32 --requests 200 --latency 0.05
+#   python bench.py --rate-429 0.05 --json > bench.json
+import argparse
+import contextlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from fake_spotify import FakeSpotify, add_config_args, config_from_args
+
+ROUTES = [
+    "/api/recommendations",
+    "/api/recommendations/recent",
+    "/api/recommendations/sources",
+    "/api/liked-tracks?limit=20&offset=0",
+]
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, int(round(p / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+def start_app(api_base):
+    # app は環境変数を読むので、import 前にスタンドインへ向ける
+    os.environ["SPOTIFY_API_BASE"] = api_base
+    os.environ.setdefault("SPOTIPY_CLIENT_ID", "")
+    import app as server
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    httpd = make_server("127.0.0.1", 0, server.app, threaded=True)
+    threading.Thread(target=httpd.serve_forever, name="bench-app", daemon=True).start()
+    return server, httpd, f"http://127.0.0.1:{httpd.server_port}"
+
+
+def login_cookie(server, user_n):
+    # OAuth を通さず、アクセストークン入りのセッションを直接作る
+    flask_app = server.app
+    with flask_app.test_request_context("/"):
+        from flask import request
+        iface = flask_app.session_interface
+        sess = iface.open_session(flask_app, request)
+        sess["token_info"] = {
+            "access_token": f"bench-token-{user_n}",
+            "refresh_token": f"bench-refresh-{user_n}",
+            "expires_at": int(time.time()) + 24 * 3600,
+        }
+        sess["user_id"] = f"bench-user-{user_n}"
+        resp = flask_app.response_class()
+        iface.save_session(flask_app, sess, resp)
+    cookie = resp.headers["Set-Cookie"].split(";", 1)[0]
+    name, value = cookie.split("=", 1)
+    return name, value
+
+
+def run_scenario(base_url, route, cookies, concurrency, total, fake):
+    sessions = []
+    for name, value in cookies:
+        s = requests.Session()
+        s.cookies.set(name, value)
+        sessions.append(s)
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(i):
+        nonlocal errors
+        s = sessions[i % len(sessions)]
+        t0 = time.perf_counter()
+        try:
+            r = s.get(base_url + route, timeout=60)
+            ok = r.status_code < 400
+        except Exception:
+            ok = False
+        dt = time.perf_counter() - t0
+        with lock:
+            latencies.append(dt)
+            if not ok:
+                errors += 1
+
+    fake.reset_counters()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "route": route.split("?", 1)[0],
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "throughput_rps": round(total / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "upstream_per_request": round(fake.calls / total, 2),
+        "upstream_429": fake.throttled,
+        # 上流への TCP 接続数。接続プールが使い回されていれば同時実行数程度に収まる
+        "upstream_connections": fake.connections,
+        "upstream_by_endpoint": dict(fake.by_endpoint),
+    }
+
+
+def print_table(results):
+    header = f"{'route':32} {'conc':>4} {'req':>5} {'err':>4} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'up/req':>7} {'429':>5} {'conn':>5}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['route']:32} {r['concurrency']:>4} {r['requests']:>5} {r['errors']:>4} "
+              f"{r['throughput_rps']:>8} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8} "
+              f"{r['upstream_per_request']:>7} {r['upstream_429']:>5} {r['upstream_connections']:>5}")
+
+
+def main(argv=None):
+    parser = add_config_args(argparse.ArgumentParser(description="Offline load test against a fake Spotify API"))
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="requests per route and concurrency level")
+    parser.add_argument("--users", type=int, default=8, help="distinct logged-in sessions to rotate through")
+    parser.add_argument("--routes", default=",".join(ROUTES))
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    # アプリのログ（print）は stderr へ逃がし、stdout には結果だけを出す（--json > bench.json が壊れないように）
+    with contextlib.redirect_stdout(sys.stderr):
+        results = _run(args)
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        print_table(results)
+    return results
+
+
+def _run(args):
+    fake = FakeSpotify(config_from_args(args))
+    api_base = fake.start()
+    server, httpd, base_url = start_app(api_base)
+    cookies = [login_cookie(server, n) for n in range(args.users)]
+
+    # 履歴ページ用に各ユーザーのおすすめ履歴を作っておく
+    for name, value in cookies:
+        s = requests.Session()
+        s.cookies.set(name, value)
+        for _ in range(3):
+            s.get(base_url + "/api/recommendations", timeout=60)
+
+    results = []
+    for conc in [int(c) for c in args.concurrency.split(",") if c.strip()]:
+        for route in [r for r in args.routes.split(",") if r.strip()]:
+            results.append(run_scenario(base_url, route, cookies, conc, args.requests, fake))
+
+    # 候補プールが空のままなら、おすすめは旧来のフォールバック経路しか測れていない
+    pool_size = len(server.candidate_pool)
+    print(f"[BENCH] candidate pool: {pool_size} tracks", file=sys.stderr)
+    if not pool_size:
+        print("[BENCH] warning: the candidate pool stayed empty; /api/recommendations only exercised the fallback path",
+              file=sys.stderr)
+
+    httpd.shutdown()
+    fake.stop()
+    return results
+
+
+if __name__ == "__main__":
+    main()
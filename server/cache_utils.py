@@ -0,0 +1,111 @@
+# server/cache_utils.py
+# プロセス共有のキャッシュ部品（LRU+TTL / single-flight）
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+_MISSING = object()
+
+
+class LRUTTLCache:
+    """Thread-safe LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize=256, ttl=300, name=None):
+        self.name = name  # 指定するとヒット率を metrics に記録する
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING and item[0] <= time.monotonic():
+                del self._data[key]
+                item = _MISSING
+            if item is not _MISSING:
+                self._data.move_to_end(key)
+        if self.name:
+            metrics.record_cache(self.name, item is not _MISSING)
+        return default if item is _MISSING else item[1]
+
+    def peek(self, key):
+        # 期限切れでも消さずに (value, expired) を返す（再検証用）
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return None, True
+            expires_at, value = item
+            return value, expires_at <= time.monotonic()
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, _MISSING)
+            return default if item is _MISSING else item[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def items(self):
+        # スナップショット用: (key, value, 期限の壁時計時刻) を古い順に。期限切れも含める
+        offset = time.time() - time.monotonic()
+        with self._lock:
+            return [(k, v, exp + offset) for k, (exp, v) in self._data.items()]
+
+    def __len__(self):
+        return len(self._data)
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one execution."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._calls
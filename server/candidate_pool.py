@@ -0,0 +1,257 @@
+# server/candidate_pool.py
+# おすすめ候補プール
+# ソースプレイリストを全ページ読み込み、曲は列指向（IDの配列 + 数値配列）で持つ。
+# Spotify の入れ子 dict は保持しないので、曲数が増えてもメモリはほぼ ID 分だけ。
+# 表示用の曲オブジェクトは読み込み時に compact な形で TrackStore に入れておき、抽選した k 件だけそこから引く。
+# 行はソースごとに参照数を数え、プレイリストが入れ替わって誰も使わなくなった行は再利用する
+# （毎週更新される編集プレイリストを読み直しても列は伸び続けない）。
+import bisect
+import random
+import sys
+import threading
+import time
+from array import array
+
+from cache_utils import SingleFlight
+from discovery_cache import is_dead_error
+from fanout import wait_result
+from track_store import compact_track
+
+PAGE_LIMIT = 100  # playlist_items の上限
+# 表示に使うフィールドも一緒に取る（抽選後に sp.tracks で取り直さなくて済むように）
+ITEM_FIELDS = ("total,limit,items(track(id,name,uri,is_local,duration_ms,popularity,"
+               "artists(id,name),album(id,name,images),external_urls))")
+
+
+class Candidate:
+    __slots__ = ("id", "duration_ms", "popularity")
+
+    def __init__(self, id, duration_ms, popularity):
+        self.id = id
+        self.duration_ms = duration_ms
+        self.popularity = popularity
+
+
+class _Source:
+    __slots__ = ("snapshot_id", "rows", "loaded_at")
+
+    def __init__(self, snapshot_id, rows, loaded_at):
+        self.snapshot_id = snapshot_id
+        self.rows = rows  # array('I') of pool rows, playlist order
+        self.loaded_at = loaded_at
+
+
+class CandidatePool:
+    def __init__(self, ttl=3600, max_tracks_per_source=2000, timeout=10, dead=None, track_store=None):
+        self.ttl = ttl
+        self.dead = dead  # DeadPlaylists（任意）
+        self.track_store = track_store  # 読み込んだ曲の表示用データを入れる先（任意）
+        self.max_tracks_per_source = max_tracks_per_source
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self._sources = {}  # (playlist_id, market) -> _Source
+        # 列: 行番号で引く（空き行の _ids は None）
+        self._row_of = {}
+        self._ids = []
+        self._duration = array("I")
+        self._popularity = array("B")
+        self._refs = array("I")  # 行を参照しているソース内の出現数
+        self._free = []  # 再利用できる行番号
+
+    def __len__(self):
+        return len(self._row_of)
+
+    def track_ids(self):
+        with self._lock:
+            return list(self._row_of)
+
+    def _intern_rows(self, tracks):
+        rows = array("I")
+        with self._lock:
+            for t in tracks:
+                tid = t["id"]
+                row = self._row_of.get(tid)
+                if row is None:
+                    duration = max(0, int(t.get("duration_ms") or 0))
+                    popularity = min(255, max(0, int(t.get("popularity") or 0)))
+                    if self._free:
+                        row = self._free.pop()
+                        self._ids[row] = sys.intern(tid)
+                        self._duration[row] = duration
+                        self._popularity[row] = popularity
+                    else:
+                        row = len(self._ids)
+                        self._ids.append(sys.intern(tid))
+                        self._duration.append(duration)
+                        self._popularity.append(popularity)
+                        self._refs.append(0)
+                    self._row_of[tid] = row
+                self._refs[row] += 1
+                rows.append(row)
+        return rows
+
+    def _set_source(self, key, src):
+        # ソースを差し替え（src=None で削除）、古い版だけが使っていた行を空ける
+        with self._lock:
+            old = self._sources.pop(key, None)
+            if src is not None:
+                self._sources[key] = src
+            if old is None:
+                return
+            for row in old.rows:
+                self._refs[row] -= 1
+                if not self._refs[row]:
+                    del self._row_of[self._ids[row]]
+                    self._ids[row] = None
+                    self._free.append(row)
+
+    def prune(self, max_idle=None):
+        """Drop sources nobody has reloaded for `max_idle` seconds (default 3 x ttl, at least an hour)."""
+        cutoff = time.time() - (max_idle if max_idle is not None else max(3 * self.ttl, 3600))
+        stale = [key for key, src in list(self._sources.items()) if src.loaded_at < cutoff]
+        for key in stale:
+            self._set_source(key, None)
+        return len(stale)
+
+    # ---- loading ----
+    def loaded(self, playlist_id, market=None):
+        src = self._sources.get((playlist_id, market))
+        return src is not None and bool(src.rows)
+
+    def fresh(self, playlist_id, market=None):
+        # TTL 内なら読み直し不要
+        src = self._sources.get((playlist_id, market))
+        return src is not None and time.time() - src.loaded_at < self.ttl
+
+    def load(self, sp, playlist_id, fanout, market=None):
+        """Make sure the whole playlist is in the pool; returns its track count."""
+        key = (playlist_id, market)
+        src = self._sources.get(key)
+        if src is not None and time.time() - src.loaded_at < self.ttl:
+            return len(src.rows)
+        if self.dead is not None and self.dead.blocked(playlist_id, market):
+            return 0
+        try:
+            count = self._flight.do(key, lambda: self._load(sp, key, fanout))
+        except Exception as e:
+            if is_dead_error(e):
+                # 消えたプレイリストの行は手放す
+                self._set_source(key, None)
+                if self.dead is not None:
+                    self.dead.failed(playlist_id, market, f"HTTP {e.http_status}")
+            raise
+        if self.dead is not None:
+            if count:
+                self.dead.succeeded(playlist_id, market)
+            else:
+                self.dead.failed(playlist_id, market, "empty")
+        return count
+
+    def _load(self, sp, key, fanout):
+        playlist_id, market = key
+        src = self._sources.get(key)
+        if src is not None and time.time() - src.loaded_at < self.ttl:
+            return len(src.rows)
+        head = sp.playlist(playlist_id, fields="snapshot_id", market=market) or {}
+        snapshot_id = head.get("snapshot_id")
+        if src is not None and snapshot_id and snapshot_id == src.snapshot_id:
+            # 中身は変わっていない
+            src.loaded_at = time.time()
+            return len(src.rows)
+
+        deadline = time.monotonic() + self.timeout
+        first = sp.playlist_items(playlist_id, fields=ITEM_FIELDS, limit=PAGE_LIMIT, offset=0, market=market) or {}
+        total = min(first.get("total") or 0, self.max_tracks_per_source)
+        step = first.get("limit") or len(first.get("items") or []) or PAGE_LIMIT
+        # 残りのページはまとめて並列に取りに行く
+        futs = [
+            fanout.submit(sp.playlist_items, playlist_id, fields=ITEM_FIELDS, limit=step, offset=off, market=market)
+            for off in range(step, total, step)
+        ]
+        tracks = []
+        missing = 0
+        for page in [first] + [wait_result(f, deadline, default=None) for f in futs]:
+            if page is None:
+                missing += 1
+                continue
+            for it in page.get("items") or []:
+                t = it.get("track") or {}
+                if t.get("id") and not t.get("is_local"):
+                    tracks.append(t)
+        tracks = tracks[:self.max_tracks_per_source]
+        if self.track_store is not None:
+            self.track_store.add_tracks([compact_track(t) for t in tracks])
+        rows = self._intern_rows(tracks)
+        if not rows:
+            # 空は覚えない（dead 側のバックオフで再試行を間引く）
+            self._set_source(key, None)
+            return 0
+        if missing:
+            # 取れなかったページがある。snapshot_id を覚えると「変わっていない」と判定されて
+            # 欠けたまま残り続けるので、次の読み直しでは全ページ取り直す
+            snapshot_id = None
+        self._set_source(key, _Source(snapshot_id, rows, time.time()))
+        pruned = self.prune()
+        print(f"[POOL] loaded {playlist_id} ({market or '-'}): {len(rows)} tracks, pool {len(self)}"
+              + (f", {missing} pages missing" if missing else "")
+              + (f", pruned {pruned} idle sources" if pruned else ""))
+        return len(rows)
+
+    # ---- snapshot ----
+    def export_state(self):
+        with self._lock:
+            return {
+                "ids": list(self._ids),
+                "duration": self._duration.tolist(),
+                "popularity": self._popularity.tolist(),
+                "sources": [[pid, market, s.snapshot_id, s.rows.tolist(), s.loaded_at]
+                            for (pid, market), s in self._sources.items()],
+            }
+
+    def import_state(self, state):
+        # 行番号はこのプロセスで振り直す（既に読み込み済みのソースは上書きしない）
+        ids, duration, popularity = state["ids"], state["duration"], state["popularity"]
+        count = 0
+        for pid, market, snapshot_id, rows, loaded_at in state["sources"]:
+            key = (pid, market)
+            if key in self._sources:
+                continue
+            tracks = [{"id": ids[r], "duration_ms": duration[r], "popularity": popularity[r]} for r in rows]
+            self._set_source(key, _Source(snapshot_id, self._intern_rows(tracks), loaded_at))
+            count += 1
+        return count
+
+    # ---- sampling ----
+    def sample(self, keys, k, exclude=()):
+        """Up to k distinct candidate ids drawn uniformly from the given sources, in O(k)."""
+        srcs = [src for src in (self._sources.get(key) for key in keys) if src is not None]
+        sizes = [len(s.rows) for s in srcs]
+        cum = []
+        n = 0
+        for size in sizes:
+            n += size
+            cum.append(n)
+        if not n:
+            return []
+        skip = set(exclude)
+        out = []
+        seen = set()
+        # 同じ曲が複数のソースにあると重複するので、少し多めに引いて詰める
+        for i in random.sample(range(n), min(n, k * 2 + 8)):
+            s = bisect.bisect_right(cum, i)
+            row = srcs[s].rows[i - (cum[s - 1] if s else 0)]
+            tid = self._ids[row]
+            if tid is None or tid in seen or tid in skip:
+                continue
+            seen.add(tid)
+            out.append(tid)
+            if len(out) >= k:
+                break
+        return out
+
+    def candidate(self, track_id):
+        row = self._row_of.get(track_id)
+        if row is None:
+            return None
+        return Candidate(self._ids[row], self._duration[row], self._popularity[row])
@@ -0,0 +1,204 @@
+# server/circuit_breaker.py
+# Spotify のエンドポイント別サーキットブレーカー
+# 直近 window 秒の呼び出しでエラー率か遅延率がしきい値を超えたら open にして即座に失敗させ、
+# open_for 秒後に half-open で1本だけ試す（成功で closed、失敗でまた open）。
+# LastKnownGood: 最後に取れた結果をキーごとに覚えておき、上流が落ちている間はそれを stale として返す。
+import threading
+import time
+from collections import deque
+
+from spotipy.exceptions import SpotifyException
+
+import metrics
+from cache_utils import LRUTTLCache
+from governor import background
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(SpotifyException):
+    def __init__(self, endpoint, retry_in):
+        super().__init__(503, -1, f"circuit open for {endpoint}, retry in {retry_in:.1f}s")
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+def is_failure(status):
+    # 上流の不調とみなすもの（通信エラー / 429 / 5xx）。401/403/404 は呼び出し側の問題
+    return status == 0 or status == 429 or status >= 500
+
+
+def is_outage(e):
+    # 古い結果で代用してよい失敗か（認証切れやスコープ不足はそのまま返す）
+    if isinstance(e, SpotifyException):
+        return is_failure(getattr(e, "http_status", None) or 0)
+    return True
+
+
+class _Breaker:
+    __slots__ = ("state", "calls", "opened_at", "probing")
+
+    def __init__(self):
+        self.state = CLOSED
+        self.calls = deque()  # (ts, failed, slow)
+        self.opened_at = 0.0
+        self.probing = False
+
+
+class CircuitBreakers:
+    def __init__(self, window=30, min_calls=10, error_rate=0.5, slow_call=2.0, slow_rate=0.5, open_for=15):
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call = slow_call  # これ以上かかった呼び出しを「遅い」と数える（秒）
+        self.slow_rate = slow_rate
+        self.open_for = open_for
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def _get(self, endpoint):
+        b = self._breakers.get(endpoint)
+        if b is None:
+            b = self._breakers[endpoint] = _Breaker()
+        return b
+
+    def _transition(self, endpoint, b, state):
+        b.state = state
+        metrics.record_breaker(endpoint, state)
+        print(f"[BREAKER] {endpoint}: -> {state}")
+
+    def before(self, endpoint):
+        """Raise CircuitOpen unless a call to `endpoint` may go out now."""
+        with self._lock:
+            b = self._get(endpoint)
+            if b.state == CLOSED:
+                return
+            now = time.monotonic()
+            if b.state == OPEN:
+                retry_in = b.opened_at + self.open_for - now
+                if retry_in > 0:
+                    raise CircuitOpen(endpoint, retry_in)
+                self._transition(endpoint, b, HALF_OPEN)
+            # half-open: 1本だけ通して様子を見る
+            if b.probing:
+                raise CircuitOpen(endpoint, 0.0)
+            b.probing = True
+
+    def cancel(self, endpoint):
+        # before() の後に呼び出し自体を取りやめた（流量制御で弾かれた等）
+        with self._lock:
+            self._get(endpoint).probing = False
+
+    def record(self, endpoint, status, duration):
+        failed = is_failure(status)
+        slow = duration >= self.slow_call
+        now = time.monotonic()
+        with self._lock:
+            b = self._get(endpoint)
+            if b.state == HALF_OPEN:
+                b.probing = False
+                if failed or slow:
+                    b.opened_at = now
+                    self._transition(endpoint, b, OPEN)
+                else:
+                    b.calls.clear()
+                    self._transition(endpoint, b, CLOSED)
+                return
+            if b.state == OPEN:
+                return
+            b.calls.append((now, failed, slow))
+            while b.calls and b.calls[0][0] < now - self.window:
+                b.calls.popleft()
+            n = len(b.calls)
+            if n < self.min_calls:
+                return
+            errors = sum(1 for _, f, _ in b.calls if f)
+            slows = sum(1 for _, _, s in b.calls if s)
+            if errors / n >= self.error_rate or slows / n >= self.slow_rate:
+                b.opened_at = now
+                b.calls.clear()
+                self._transition(endpoint, b, OPEN)
+
+    def retry_in(self):
+        """Seconds until the next open breaker may half-open (0 when none are open)."""
+        now = time.monotonic()
+        with self._lock:
+            waits = [b.opened_at + self.open_for - now for b in self._breakers.values() if b.state == OPEN]
+        return max(0.0, min(waits)) if waits else 0.0
+
+    def open_count(self):
+        with self._lock:
+            return sum(1 for b in self._breakers.values() if b.state != CLOSED)
+
+    def stats(self):
+        with self._lock:
+            return {ep: b.state for ep, b in self._breakers.items() if b.state != CLOSED}
+
+
+class LastKnownGood:
+    def __init__(self, breakers=None, maxsize=500, ttl=86400, min_delay=5.0):
+        self.breakers = breakers
+        self.min_delay = min_delay  # 再検証を試みるまでの最短待ち（秒）
+        self._cache = LRUTTLCache(maxsize=maxsize, ttl=ttl, name="last_good")
+        self._revalidating = set()
+        self._lock = threading.Lock()
+
+    def call(self, key, load, valid=None):
+        """Run `load` and remember its result; returns (value, stale).
+
+        When `load` fails with an outage error (or returns something `valid`
+        rejects) and a previous result exists, that result is returned with
+        stale=True and a background revalidation is scheduled.
+        """
+        try:
+            value = load()
+        except Exception as e:
+            if not is_outage(e):
+                raise
+            cached, _ = self._cache.peek(key)
+            if cached is None:
+                raise
+            return self._stale(key, load, valid, cached, e)
+        if valid is not None and not valid(value):
+            cached, _ = self._cache.peek(key)
+            if cached is None:
+                return value, False
+            return self._stale(key, load, valid, cached, "empty result")
+        self._cache.set(key, value)
+        return value, False
+
+    def _stale(self, key, load, valid, cached, reason):
+        metrics.record_stale(key[0])
+        print(f"[STALE] {key[0]}: serving last known good ({reason})")
+        self._revalidate(key, load, valid)
+        return cached, True
+
+    def _revalidate(self, key, load, valid):
+        # 同じキーの再検証は1本だけ。ブレーカーが half-open になる頃に裏で取り直す
+        with self._lock:
+            if key in self._revalidating:
+                return
+            self._revalidating.add(key)
+        delay = max(self.min_delay, self.breakers.retry_in() if self.breakers is not None else 0.0)
+
+        def run():
+            try:
+                with background():
+                    value = load()
+                if valid is None or valid(value):
+                    self._cache.set(key, value)
+                    print(f"[STALE] {key[0]}: revalidated")
+            except Exception as e:
+                print(f"[STALE] {key[0]}: revalidation failed: {e}")
+            finally:
+                with self._lock:
+                    self._revalidating.discard(key)
+
+        timer = threading.Timer(delay, run)
+        timer.daemon = True
+        timer.start()
+
+    def __len__(self):
+        return len(self._cache)
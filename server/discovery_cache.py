@@ -0,0 +1,117 @@
+# server/discovery_cache.py
+# プレイリスト探索まわりのキャッシュ
+# - QueryCache: search / カテゴリ一覧の結果を (種類, クエリ, type, market, limit) ごとに共有
+# - DeadPlaylists: 403/404 や空だったプレイリストを指数バックオフで一定時間スキップする
+import threading
+import time
+from collections import OrderedDict
+
+from spotipy.exceptions import SpotifyException
+
+import metrics
+from cache_utils import LRUTTLCache, SingleFlight
+
+DEAD_STATUSES = (403, 404)
+
+
+def is_dead_error(e):
+    # 消えた / 地域制限のプレイリスト（一時的な 429 や 5xx は含めない）
+    return isinstance(e, SpotifyException) and getattr(e, "http_status", None) in DEAD_STATUSES
+
+
+class QueryCache:
+    def __init__(self, maxsize=512, ttl=1800):
+        self._cache = LRUTTLCache(maxsize=maxsize, ttl=ttl, name="discovery")
+        self._flight = SingleFlight()
+
+    def _get(self, key, load):
+        value = self._cache.get(key)
+        if value is not None:
+            return value
+
+        def fill():
+            cached, expired = self._cache.peek(key)
+            if cached is not None and not expired:
+                return cached
+            value = load() or {}
+            self._cache.set(key, value)
+            return value
+        return self._flight.do(key, fill)
+
+    def search(self, sp, q, type="playlist", market=None, limit=10):
+        return self._get(("search", q, type, market, limit),
+                         lambda: sp.search(q=q, type=type, limit=limit, market=market))
+
+    def category_playlists(self, sp, category, country=None, limit=20):
+        return self._get(("category", category, "playlist", country, limit),
+                         lambda: sp.category_playlists(category, country=country, limit=limit))
+
+    def clear(self):
+        self._cache.clear()
+
+    # ---- snapshot ----
+    def export_state(self):
+        return [[list(k), v, expires] for k, v, expires in self._cache.items()]
+
+    def import_state(self, state):
+        now = time.time()
+        count = 0
+        for key, value, expires in state:
+            key = tuple(key)
+            mine, expired = self._cache.peek(key)
+            if expires > now and (mine is None or expired):
+                self._cache.set(key, value, ttl=expires - now)
+                count += 1
+        return count
+
+
+class DeadPlaylists:
+    def __init__(self, base=300, max_backoff=86400, maxsize=5000):
+        self.base = base  # 1回目の失敗でスキップする秒数（以降は倍々）
+        self.max_backoff = max_backoff
+        self.maxsize = maxsize
+        self._data = OrderedDict()  # (playlist_id, market) -> (until, failures)
+        self._lock = threading.Lock()
+
+    def blocked(self, playlist_id, market=None):
+        with self._lock:
+            item = self._data.get((playlist_id, market))
+        hit = item is not None and item[0] > time.time()
+        metrics.record_cache("dead_playlists", hit)
+        return hit
+
+    def failed(self, playlist_id, market=None, reason=""):
+        key = (playlist_id, market)
+        with self._lock:
+            _, failures = self._data.get(key, (0, 0))
+            failures += 1
+            backoff = min(self.max_backoff, self.base * 2 ** (failures - 1))
+            self._data[key] = (time.time() + backoff, failures)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        print(f"[DEAD] {playlist_id} ({market or '-'}): {reason or 'failed'}, skipping for {backoff}s")
+
+    def succeeded(self, playlist_id, market=None):
+        with self._lock:
+            self._data.pop((playlist_id, market), None)
+
+    # ---- snapshot ----
+    def export_state(self):
+        now = time.time()
+        with self._lock:
+            return [[pid, market, until, failures]
+                    for (pid, market), (until, failures) in self._data.items() if until > now]
+
+    def import_state(self, state):
+        now = time.time()
+        count = 0
+        with self._lock:
+            for pid, market, until, failures in state:
+                if until > now and (pid, market) not in self._data:
+                    self._data[(pid, market)] = (until, failures)
+                    count += 1
+        return count
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,276 @@
+# server/fake_spotify.py
+# ベンチマーク用のローカル Spotify Web API スタンドイン
+# app.py の SPOTIFY_API_BASE をこのサーバに向けると、本物の API なしで全ルートを動かせる。
+#
+#   python fake_spotify.py --port 9000 --latency 0.05 --rate-429 0.02
+#   SPOTIFY_API_BASE=http://127.0.0.1:9000/v1/ python app.py
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+_B62 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+
+
+def fake_id(kind, n):
+    # 決定的な22文字の base62 ID
+    digest = hashlib.sha1(f"{kind}:{n}".encode()).digest()
+    num = int.from_bytes(digest, "big")
+    out = []
+    for _ in range(22):
+        num, r = divmod(num, 62)
+        out.append(_B62[r])
+    return "".join(out)
+
+
+class FakeConfig:
+    def __init__(self, latency=0.03, jitter=0.01, rate_429=0.0, retry_after=1,
+                 max_page=50, playlist_size=100, liked_total=2000, recent_total=50,
+                 search_results=10, market="JP"):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.max_page = max_page
+        self.playlist_size = playlist_size
+        self.liked_total = liked_total
+        self.recent_total = recent_total
+        self.search_results = search_results
+        self.market = market
+
+
+class FakeSpotify:
+    def __init__(self, config=None):
+        self.config = config or FakeConfig()
+        self.calls = 0
+        self.throttled = 0
+        self.connections = 0
+        self.by_endpoint = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    # ---- data ----
+    def track(self, n):
+        tid = fake_id("track", n)
+        return {
+            "id": tid,
+            "name": f"Fake Track {n}",
+            "type": "track",
+            "uri": f"spotify:track:{tid}",
+            "is_local": False,
+            "duration_ms": 150000 + (n * 7919) % 150000,
+            "popularity": n % 100,
+            "explicit": False,
+            "available_markets": ["JP", "US", "GB", "DE", "FR"],
+            "external_urls": {"spotify": f"https://open.spotify.com/track/{tid}"},
+            "artists": [{"id": fake_id("artist", n % 97), "name": f"Fake Artist {n % 97}", "type": "artist"}],
+            "album": {
+                "id": fake_id("album", n % 211),
+                "name": f"Fake Album {n % 211}",
+                "available_markets": ["JP", "US", "GB", "DE", "FR"],
+                "images": [
+                    {"url": f"https://i.example/{n}/640", "width": 640, "height": 640},
+                    {"url": f"https://i.example/{n}/300", "width": 300, "height": 300},
+                    {"url": f"https://i.example/{n}/64", "width": 64, "height": 64},
+                ],
+            },
+        }
+
+    def _track_index(self, tid):
+        return self._ids.get(tid)
+
+    def _build_index(self, n):
+        self._ids = {fake_id("track", i): i for i in range(n)}
+
+    def features(self, n):
+        return {
+            "id": fake_id("track", n),
+            "tempo": 60.0 + (n * 37) % 120,
+            "key": n % 12,
+            "mode": n % 2,
+            "energy": ((n * 13) % 100) / 100.0,
+            "danceability": ((n * 29) % 100) / 100.0,
+            "valence": ((n * 41) % 100) / 100.0,
+            "acousticness": ((n * 53) % 100) / 100.0,
+            "loudness": -((n * 7) % 30) * 1.0,
+        }
+
+    def playlist_stub(self, n):
+        pid = fake_id("playlist", n)
+        return {"id": pid, "name": f"Fake Playlist {n}", "owner": {"id": "spotify", "display_name": "Spotify"},
+                "tracks": {"total": self.config.playlist_size}}
+
+    def _page(self, items_fn, total, params):
+        limit = min(int(params.get("limit", 20)), self.config.max_page)
+        offset = int(params.get("offset", 0))
+        items = [items_fn(i) for i in range(offset, min(offset + limit, total))]
+        return {"items": items, "total": total, "limit": limit, "offset": offset,
+                "next": None if offset + limit >= total else "next"}
+
+    def _playlist_base(self, pid):
+        # プレイリストIDごとに別の曲レンジを割り当てる
+        return int(hashlib.sha1(pid.encode()).hexdigest(), 16) % 5000
+
+    # ---- routing ----
+    def handle(self, method, path, params):
+        segs = [s for s in path.split("/") if s][1:]  # drop "v1"
+        c = self.config
+        if segs == ["me"]:
+            return {"id": "fake-user", "display_name": "Fake User", "country": c.market, "product": "premium",
+                    "email": "fake@example.com", "images": [], "external_urls": {}}
+        if segs == ["me", "player", "recently-played"]:
+            limit = min(int(params.get("limit", 20)), c.max_page)
+            now_ms = int(time.time() * 1000)
+            after = int(params.get("after", 0))
+            items = []
+            for i in range(min(limit, c.recent_total)):
+                played = now_ms - i * 180000
+                if played <= after:
+                    break
+                items.append({"track": self.track(i), "played_at": time.strftime(
+                    "%Y-%m-%dT%H:%M:%S", time.gmtime(played / 1000)) + ".000Z"})
+            return {"items": items, "cursors": {"after": str(now_ms)} if items else None}
+        if segs == ["me", "tracks"]:
+            return self._page(lambda i: {"added_at": time.strftime(
+                "%Y-%m-%dT%H:%M:%SZ", time.gmtime(1700000000 + (c.liked_total - i) * 60)),
+                "track": self.track(i)}, c.liked_total, params)
+        if segs[:1] == ["playlists"] and len(segs) >= 2:
+            pid = segs[1]
+            base = self._playlist_base(pid)
+            # spotipy 2.26 以降の playlist_items は /items、それより前は /tracks
+            if len(segs) == 3 and segs[2] in ("tracks", "items"):
+                return self._page(lambda i: {"track": self.track(base + i)}, c.playlist_size, params)
+            if "fields" in params and "items" not in params["fields"]:
+                return {"id": pid, "snapshot_id": "fake-snapshot", "tracks": {"total": c.playlist_size}}
+            page = self._page(lambda i: {"track": self.track(base + i)}, c.playlist_size, {"limit": 100})
+            return {"id": pid, "name": f"Fake Playlist {pid[:6]}", "snapshot_id": "fake-snapshot",
+                    "owner": {"id": "spotify", "display_name": "Spotify"}, "tracks": page}
+        if segs == ["search"]:
+            q = params.get("q", "")
+            n0 = int(hashlib.sha1(q.encode()).hexdigest(), 16) % 1000
+            limit = min(int(params.get("limit", 10)), c.search_results)
+            return {"playlists": {"items": [self.playlist_stub(n0 + i) for i in range(limit)]}}
+        if segs[:2] == ["browse", "categories"] and segs[-1] == "playlists":
+            return {"playlists": {"items": [self.playlist_stub(i) for i in range(int(params.get("limit", 20)))]}}
+        if segs == ["tracks"]:
+            ids = [x for x in params.get("ids", "").split(",") if x]
+            return {"tracks": [self.track(self._track_index(t)) if self._track_index(t) is not None else None
+                               for t in ids]}
+        if segs == ["audio-features"]:
+            ids = [x for x in params.get("ids", "").split(",") if x]
+            return {"audio_features": [self.features(self._track_index(t)) if self._track_index(t) is not None else None
+                                       for t in ids]}
+        return None
+
+    def record(self, path, throttled):
+        with self._lock:
+            self.calls += 1
+            if throttled:
+                self.throttled += 1
+            key = "/".join("{id}" if len(s) == 22 else s for s in path.split("/") if s)
+            self.by_endpoint[key] = self.by_endpoint.get(key, 0) + 1
+
+    def reset_counters(self):
+        with self._lock:
+            self.calls = 0
+            self.throttled = 0
+            self.connections = 0
+            self.by_endpoint = {}
+
+    def connected(self):
+        with self._lock:
+            self.connections += 1
+
+    # ---- server ----
+    def make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                # ハンドラは TCP 接続ごとに1つ（keep-alive 中のリクエストは同じハンドラで処理される）
+                super().setup()
+                fake.connected()
+
+            def _reply(self, status, body, headers=None):
+                data = json.dumps(body).encode("utf-8") if body is not None else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _serve(self):
+                url = urlparse(self.path)
+                params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                cfg = fake.config
+                delay = max(0.0, cfg.latency + random.uniform(-cfg.jitter, cfg.jitter))
+                if delay:
+                    time.sleep(delay)
+                throttled = cfg.rate_429 > 0 and random.random() < cfg.rate_429
+                fake.record(url.path, throttled)
+                if throttled:
+                    return self._reply(429, {"error": {"status": 429, "message": "API rate limit exceeded"}},
+                                       {"Retry-After": str(cfg.retry_after)})
+                body = fake.handle(self.command, url.path, params)
+                if body is None:
+                    return self._reply(404, {"error": {"status": 404, "message": "Not found."}})
+                return self._reply(200, body)
+
+            do_GET = _serve
+            do_POST = _serve
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self, host="127.0.0.1", port=0):
+        self._build_index(max(self.config.liked_total, 5000 + self.config.playlist_size))
+        self._server = ThreadingHTTPServer((host, port), self.make_handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="fake-spotify", daemon=True).start()
+        return f"http://{host}:{self._server.server_port}/v1/"
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
+
+
+def add_config_args(parser):
+    parser.add_argument("--latency", type=float, default=0.03, help="mean upstream latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--rate-429", type=float, default=0.0, help="probability of answering 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--max-page", type=int, default=50, help="largest page size honoured")
+    parser.add_argument("--playlist-size", type=int, default=100)
+    parser.add_argument("--liked-total", type=int, default=2000)
+    return parser
+
+
+def config_from_args(args):
+    return FakeConfig(latency=args.latency, jitter=args.jitter, rate_429=args.rate_429,
+                      retry_after=args.retry_after, max_page=args.max_page,
+                      playlist_size=args.playlist_size, liked_total=args.liked_total)
+
+
+if __name__ == "__main__":
+    parser = add_config_args(argparse.ArgumentParser(description="Local Spotify Web API stand-in"))
+    parser.add_argument("--port", type=int, default=9000)
+    args = parser.parse_args()
+    fake = FakeSpotify(config_from_args(args))
+    base = fake.start(port=args.port)
+    print(f"[FAKE] serving Spotify stand-in at {base}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
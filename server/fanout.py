@@ -0,0 +1,60 @@
+# server/fanout.py
+# Spotify呼び出しを並列に投げるための共有スレッドプール
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+
+class FanOut:
+    def __init__(self, max_workers=8, name="spotify-fanout"):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+
+    def submit(self, fn, *args, **kwargs):
+        # 呼び出し元の contextvars を引き継いで実行する
+        ctx = contextvars.copy_context()
+        return self._pool.submit(ctx.run, fn, *args, **kwargs)
+
+    def shutdown(self, wait=False):
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+
+
+def remaining(deadline):
+    return max(0.0, deadline - time.monotonic())
+
+
+def wait_result(future, deadline, default=None):
+    """Return the future's result, or `default` on error / deadline."""
+    try:
+        return future.result(timeout=remaining(deadline))
+    except FutureTimeout:
+        return default
+    except Exception:
+        return default
+
+
+def cancel_all(futures):
+    for f in futures:
+        f.cancel()
+
+
+def first_in_order(futures, deadline, accept=bool):
+    """Pick the first accepted result in priority (list) order.
+
+    Lower-priority futures are only used once every higher-priority one has
+    failed. Whatever is still pending when a winner is found is cancelled.
+    If the deadline passes, the best result that has already completed wins.
+    """
+    futures = list(futures)
+    for i, f in enumerate(futures):
+        if remaining(deadline) <= 0:
+            break
+        res = wait_result(f, deadline)
+        if accept(res):
+            cancel_all(futures[i + 1:])
+            return res
+    for f in futures:
+        if f.done() and not f.cancelled() and f.exception() is None and accept(f.result()):
+            cancel_all(futures)
+            return f.result()
+    cancel_all(futures)
+    return None
@@ -0,0 +1,187 @@
+# server/governor.py
+# Spotify 呼び出しの流量制御（トークンバケット + 優先度付き待ち行列）
+# - 画面表示に使う呼び出し（interactive）をバックグラウンドの補充処理より先に通す
+# - 429 を受けたら Retry-After の間は全体を止め、レートを半分に落としてから徐々に戻す
+# - shared_path を指定するとファイルロックで複数プロセス（gunicorn ワーカー）間でバケットを共有する
+import contextlib
+import contextvars
+import heapq
+import itertools
+import os
+import struct
+import threading
+import time
+
+from spotipy.exceptions import SpotifyException
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+priority = contextvars.ContextVar("spotify_priority", default=INTERACTIVE)
+
+
+@contextlib.contextmanager
+def background():
+    # この中（と、ここから fan-out したスレッド）の呼び出しは後回しにされる
+    token = priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        priority.reset(token)
+
+
+# state: [tokens, updated_at, blocked_until, rate_scale]
+class _LocalState:
+    def __init__(self, burst):
+        self._lock = threading.Lock()
+        self._s = [float(burst), time.time(), 0.0, 1.0]
+
+    def update(self, fn):
+        with self._lock:
+            return fn(self._s)
+
+
+class _FileState:
+    _FMT = "dddd"
+    _SIZE = struct.calcsize(_FMT)
+
+    def __init__(self, path, burst):
+        self._lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(self._fd).st_size < self._SIZE:
+                    os.pwrite(self._fd, struct.pack(self._FMT, float(burst), time.time(), 0.0, 1.0), 0)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def update(self, fn):
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                s = list(struct.unpack(self._FMT, os.pread(self._fd, self._SIZE, 0)))
+                result = fn(s)
+                os.pwrite(self._fd, struct.pack(self._FMT, *s), 0)
+                return result
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+class Governor:
+    def __init__(self, rate=20.0, burst=40, max_wait=10.0, background_max_wait=60.0,
+                 min_scale=0.1, recover_step=0.02, shared_path=None):
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait
+        self.background_max_wait = background_max_wait
+        self.min_scale = min_scale
+        self.recover_step = recover_step  # 成功1回ごとに戻すレートの割合
+        if shared_path and fcntl is not None:
+            self._state = _FileState(shared_path, burst)
+        else:
+            if shared_path:
+                print("[GOV] fcntl unavailable, using a per-process bucket")
+            self._state = _LocalState(burst)
+        self._cond = threading.Condition()
+        self._queue = []  # heap of (priority, seq)
+        self._seq = itertools.count()
+        self._depth = {INTERACTIVE: 0, BACKGROUND: 0}
+
+    # ---- bucket ops (run under the state lock) ----
+    def _refill(self, s, now):
+        s[0] = min(float(self.burst), s[0] + max(0.0, now - s[1]) * self.rate * s[3])
+        s[1] = now
+
+    def _take(self, s):
+        now = time.time()
+        self._refill(s, now)
+        if now < s[2]:
+            return s[2] - now
+        if s[0] >= 1.0:
+            s[0] -= 1.0
+            return 0.0
+        return (1.0 - s[0]) / (self.rate * s[3])
+
+    # ---- public ----
+    def acquire(self, prio=None):
+        """Block until a token is granted to this caller; returns the seconds spent waiting."""
+        prio = priority.get() if prio is None else prio
+        limit = self.max_wait if prio == INTERACTIVE else self.background_max_wait
+        started = time.monotonic()
+        ticket = (prio, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._queue, ticket)
+            self._depth[prio] += 1
+            try:
+                while True:
+                    wait = None
+                    if self._queue[0] == ticket:
+                        wait = self._state.update(self._take)
+                        if wait == 0.0:
+                            break
+                    remaining = limit - (time.monotonic() - started)
+                    if remaining <= 0:
+                        raise SpotifyException(429, -1, "client-side rate limit: waited %.1fs for a slot" % limit)
+                    # 先頭は次のトークンまで、それ以外は先頭が抜けるまで待つ
+                    self._cond.wait(min(wait, remaining) if wait is not None else remaining)
+            finally:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                self._depth[prio] -= 1
+                self._cond.notify_all()
+        waited = time.monotonic() - started
+        metrics.record_queue_wait(PRIORITY_NAMES.get(prio, str(prio)), waited)
+        return waited
+
+    def throttled(self, retry_after=None):
+        # 429: Retry-After の間は誰も通さず、レートを半分に
+        retry_after = float(retry_after or 1.0)
+
+        def apply(s):
+            now = time.time()
+            self._refill(s, now)
+            # 同じ停止期間中に届いた 429 で何度も半減させない
+            if now >= s[2]:
+                s[3] = max(self.min_scale, s[3] * 0.5)
+            s[0] = min(s[0], 0.0)
+            s[2] = max(s[2], now + retry_after)
+            return s[3]
+        scale = self._state.update(apply)
+        print(f"[GOV] 429 from Spotify: pausing {retry_after:.1f}s, rate -> {self.rate * scale:.1f}/s")
+        with self._cond:
+            self._cond.notify_all()
+
+    def succeeded(self):
+        def apply(s):
+            if s[3] < 1.0:
+                now = time.time()
+                self._refill(s, now)
+                s[3] = min(1.0, s[3] + self.recover_step)
+        self._state.update(apply)
+
+    def queue_depth(self, prio=None):
+        if prio is None:
+            return sum(self._depth.values())
+        return self._depth.get(prio, 0)
+
+    def current_rate(self):
+        return self.rate * self._state.update(lambda s: s[3])
+
+    def stats(self):
+        blocked_until = self._state.update(lambda s: s[2])
+        return {
+            "rate": round(self.current_rate(), 2),
+            "configured_rate": self.rate,
+            "burst": self.burst,
+            "queue": {PRIORITY_NAMES[p]: n for p, n in self._depth.items()},
+            "paused_for": round(max(0.0, blocked_until - time.time()), 2),
+        }
@@ -0,0 +1,46 @@
+# server/gunicorn.conf.py
+# 本番用 gunicorn 設定
+# gevent ワーカーで spotipy / requests のソケット I/O を協調的にし、
+# 1ワーカーで数百の Spotify 呼び出しを同時に待てるようにする。
+import multiprocessing
+import os
+
+from dotenv import load_dotenv
+
+# gunicorn を直接起動した場合も、マスターで .env を読んでおく（下の起動チェック用）
+load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env"))
+
+bind = f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = os.environ.get("WORKER_CLASS", "gevent")
+worker_connections = int(os.environ.get("WORKER_CONNECTIONS", "500"))
+
+# 上流待ちが長いリクエストもあるので余裕を持たせる
+timeout = int(os.environ.get("WORKER_TIMEOUT", "60"))
+# SIGTERM 後、処理中のリクエストを待つ秒数
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+
+# メモリリーク対策で一定リクエストごとにワーカーを入れ替える
+max_requests = int(os.environ.get("MAX_REQUESTS", "5000"))
+max_requests_jitter = 500
+
+accesslog = "-"
+errorlog = "-"
+
+
+def on_starting(server):
+    # 再生ログがメモリ上（PLAY_LOG_PATH 未設定）だとワーカーごとに別の履歴になり、
+    # /api/recently-played や /api/history/top の結果がリクエストごとに変わってしまう
+    if server.cfg.workers > 1 and not os.environ.get("PLAY_LOG_PATH"):
+        raise RuntimeError(
+            f"PLAY_LOG_PATH must point to a shared SQLite file when running {server.cfg.workers} workers"
+        )
+
+
+def worker_exit(server, worker):
+    try:
+        from wsgi import shutdown_background_jobs
+        shutdown_background_jobs()
+    except Exception as e:
+        server.log.warning("shutdown hook failed: %s", e)
@@ -0,0 +1,107 @@
+# server/kv_store.py
+# メモリ上のLRU + 任意のSQLiteバックエンドを持つ JSON キーバリューストア
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+
+class JsonStore:
+    """Bounded in-memory LRU of JSON values, optionally backed by a SQLite table.
+
+    With `path` set, every write also goes to disk and memory misses are
+    read back from it, so the hot set stays small while nothing is lost.
+    """
+
+    def __init__(self, table, path=None, maxsize=5000):
+        self.table = table
+        self.path = path or None
+        self.maxsize = maxsize
+        self._mem = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if self.path:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} "
+                "(k TEXT PRIMARY KEY, v TEXT NOT NULL, updated_at INTEGER NOT NULL)"
+            )
+            self._db.commit()
+
+    def _remember(self, key, value):
+        self._mem[key] = value
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.maxsize:
+            self._mem.popitem(last=False)
+
+    def get(self, key, default=None):
+        return self.get_many([key]).get(key, default)
+
+    def get_many(self, keys):
+        out = {}
+        missing = []
+        with self._lock:
+            for k in keys:
+                if k in self._mem:
+                    self._mem.move_to_end(k)
+                    out[k] = self._mem[k]
+                else:
+                    missing.append(k)
+            if missing and self._db is not None:
+                for i in range(0, len(missing), 500):
+                    chunk = missing[i:i + 500]
+                    marks = ",".join("?" * len(chunk))
+                    rows = self._db.execute(
+                        f"SELECT k, v FROM {self.table} WHERE k IN ({marks})", chunk
+                    ).fetchall()
+                    for k, v in rows:
+                        value = json.loads(v)
+                        out[k] = value
+                        self._remember(k, value)
+        metrics.record_cache(self.table, True, len(out))
+        metrics.record_cache(self.table, False, len(keys) - len(out))
+        return out
+
+    def put(self, key, value):
+        self.put_many({key: value})
+
+    def put_many(self, items):
+        if not items:
+            return
+        now = int(time.time())
+        with self._lock:
+            for k, v in items.items():
+                self._remember(k, v)
+            if self._db is not None:
+                self._db.executemany(
+                    f"INSERT OR REPLACE INTO {self.table} (k, v, updated_at) VALUES (?, ?, ?)",
+                    [(k, json.dumps(v, ensure_ascii=False, separators=(",", ":")), now) for k, v in items.items()],
+                )
+                self._db.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._mem.pop(key, None)
+            if self._db is not None:
+                self._db.execute(f"DELETE FROM {self.table} WHERE k = ?", (key,))
+                self._db.commit()
+
+    def items(self):
+        # メモリ上のホットセット（古い順）
+        with self._lock:
+            return list(self._mem.items())
+
+    # ---- snapshot ----
+    def export_state(self):
+        return self.items()
+
+    def import_state(self, state):
+        self.put_many(dict(state))
+        return len(state)
+
+    def __len__(self):
+        return len(self._mem)
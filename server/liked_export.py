@@ -0,0 +1,124 @@
+# server/liked_export.py
+# お気に入り全件のエクスポート（NDJSON ストリーム）
+# ユーザーごとに (added_at, track_id) と表示用の compact な曲データのスナップショットを持ち、
+# 2回目以降は最新の added_at より新しい分だけを取りに行く（既知の曲はスナップショットから流す）。
+import json
+import time
+from collections import deque
+
+from kv_store import JsonStore
+from track_store import compact_track
+
+PAGE_SIZE = 50  # current_user_saved_tracks の上限
+
+
+def _line(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def _saved_items(page):
+    return [it for it in (page or {}).get("items", []) if it.get("track") and it["track"].get("id")]
+
+
+class LikedSnapshots(JsonStore):
+    # 1件が曲データ込みで数MBになりうるので、メモリに置くのは少なめ（path があれば残りはディスクから読む）
+    def __init__(self, path=None, maxsize=64):
+        super().__init__("liked_snapshots", path=path, maxsize=maxsize)
+
+
+def fetch_first_page(sp):
+    return sp.current_user_saved_tracks(limit=PAGE_SIZE, offset=0) or {}
+
+
+def stream_export(sp, first_page, user_id, snapshots, track_store, fanout,
+                  concurrency=4, full=False):
+    """Yield NDJSON lines for the whole library, newest first."""
+    total = first_page.get("total") or 0
+    snap = snapshots.get(user_id) if (user_id and not full) else None
+
+    # 曲データを持たない古い形式のスナップショットは全件取り直しで置き換える
+    if snap and "tracks" in snap:
+        known = {tid for _, tid in snap["items"]}
+        newest = snap["items"][0][0] if snap["items"] else ""
+        new_items = []
+        page, offset, done = first_page, 0, False
+        while True:
+            for it in _saved_items(page):
+                if it.get("added_at", "") < newest or it["track"]["id"] in known:
+                    done = True
+                    break
+                new_items.append(it)
+            offset += PAGE_SIZE
+            if done or offset >= total:
+                break
+            page = sp.current_user_saved_tracks(limit=PAGE_SIZE, offset=offset) or {}
+        # 件数が合わない = どこかで削除された → 全件取り直し
+        if len(new_items) + len(snap["items"]) == total:
+            yield from _stream_incremental(sp, new_items, snap, user_id, snapshots, track_store, fanout, total)
+            return
+
+    yield from _stream_full(sp, first_page, user_id, snapshots, track_store, fanout, concurrency, total)
+
+
+def _stream_incremental(sp, new_items, snap, user_id, snapshots, track_store, fanout, total):
+    yield _line({"type": "meta", "mode": "incremental", "total": total, "new": len(new_items)})
+    track_store.add_tracks([it["track"] for it in new_items])
+    tracks = {}
+    for it in new_items:
+        t = compact_track(it["track"])
+        tracks[t["id"]] = t
+        yield _line({"type": "track", "added_at": it.get("added_at"), "track": t})
+    old = snap["items"]
+    known = snap["tracks"]
+    # 既知の曲はスナップショットから流す。欠けている分があればまとめて（並列に）取り直す
+    missing = [tid for _, tid in old if tid not in known]
+    by_id = {tid: compact_track(t) for tid, t in track_store.hydrate(sp, missing, fanout).items()} if missing else {}
+    for added_at, tid in old:
+        t = known.get(tid) or by_id.get(tid)
+        if t:
+            tracks[tid] = t
+            yield _line({"type": "track", "added_at": added_at, "track": t})
+    items = [[it.get("added_at", ""), it["track"]["id"]] for it in new_items] + old
+    snapshots.put(user_id, {"synced_at": int(time.time()), "total": total, "items": items, "tracks": tracks})
+    yield _line({"type": "done", "count": len(items)})
+
+
+def _stream_full(sp, first_page, user_id, snapshots, track_store, fanout, concurrency, total):
+    yield _line({"type": "meta", "mode": "full", "total": total})
+    items = []
+    tracks = {}
+
+    def emit(page):
+        page_items = _saved_items(page)
+        track_store.add_tracks([it["track"] for it in page_items])
+        for it in page_items:
+            t = compact_track(it["track"])
+            items.append([it.get("added_at", ""), t["id"]])
+            tracks[t["id"]] = t
+            yield _line({"type": "track", "added_at": it.get("added_at"), "track": t})
+
+    yield from emit(first_page)
+
+    # 残りのページは同時に concurrency 本まで投げ、順番通りに流す
+    offsets = iter(range(PAGE_SIZE, total, PAGE_SIZE))
+    window = deque()
+    for off in offsets:
+        window.append(fanout.submit(sp.current_user_saved_tracks, limit=PAGE_SIZE, offset=off))
+        if len(window) >= concurrency:
+            break
+    try:
+        while window:
+            page = window.popleft().result()
+            nxt = next(offsets, None)
+            if nxt is not None:
+                window.append(fanout.submit(sp.current_user_saved_tracks, limit=PAGE_SIZE, offset=nxt))
+            yield from emit(page)
+    except Exception as e:
+        for f in window:
+            f.cancel()
+        yield _line({"type": "error", "details": str(e)})
+        return
+
+    if user_id:
+        snapshots.put(user_id, {"synced_at": int(time.time()), "total": total, "items": items, "tracks": tracks})
+    yield _line({"type": "done", "count": len(items)})
@@ -0,0 +1,216 @@
+# server/metrics.py
+# リクエスト単位のレイテンシ計測と Spotify 呼び出しの集計（Prometheus テキスト形式）
+import bisect
+import contextvars
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _fmt_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + list(extra or [])
+    if not pairs:
+        return ""
+    body = ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _fmt_value(v):
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, v in items:
+            yield self.name, _fmt_labels(self.labelnames, labels), v
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name, help_text, fn):
+        self.name = name
+        self.help = help_text
+        self.fn = fn
+
+    def samples(self):
+        yield self.name, "", self.fn()
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(labels)
+            if row is None:
+                row = self._values[labels] = [0] * (len(self.buckets) + 2)
+            if i < len(self.buckets):
+                row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        for labels, row in items:
+            acc = 0
+            for b, n in zip(self.buckets, row):
+                acc += n
+                yield self.name + "_bucket", _fmt_labels(self.labelnames, labels, [("le", _fmt_value(b))]), acc
+            yield self.name + "_bucket", _fmt_labels(self.labelnames, labels, [("le", "+Inf")]), row[-1]
+            yield self.name + "_sum", _fmt_labels(self.labelnames, labels), row[-2]
+            yield self.name + "_count", _fmt_labels(self.labelnames, labels), row[-1]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self.register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name, help_text, fn):
+        return self.register(Gauge(name, help_text, fn))
+
+    def render(self):
+        lines = []
+        for m in self._metrics:
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            for name, labels, value in m.samples():
+                lines.append(f"{name}{labels} {_fmt_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_latency = registry.histogram(
+    "karapoke_http_request_duration_seconds", "Latency of API requests by route.", ("route", "method", "status"))
+upstream_calls = registry.counter(
+    "karapoke_spotify_calls_total", "Spotify Web API calls by endpoint and final status.", ("endpoint", "method", "status"))
+upstream_latency = registry.histogram(
+    "karapoke_spotify_call_duration_seconds", "Duration of Spotify Web API calls (including retries).", ("endpoint",))
+upstream_retries = registry.counter(
+    "karapoke_spotify_retries_total", "Retries issued by the HTTP adapter by response status (429 = rate limited).", ("status",))
+upstream_per_request = registry.histogram(
+    "karapoke_spotify_calls_per_request", "Spotify calls made while serving one request.", ("route",),
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55))
+cache_lookups = registry.counter(
+    "karapoke_cache_lookups_total", "Shared cache lookups by cache and result.", ("cache", "result"))
+upstream_queue_wait = registry.histogram(
+    "karapoke_spotify_queue_wait_seconds", "Time spent waiting for a rate-limit slot before a Spotify call.", ("priority",))
+breaker_transitions = registry.counter(
+    "karapoke_spotify_breaker_transitions_total", "Circuit breaker state changes by endpoint.", ("endpoint", "state"))
+stale_responses = registry.counter(
+    "karapoke_stale_responses_total", "Responses served from the last-known-good store.", ("section",))
+
+
+# ---- per-request accounting ----
+class RequestStats:
+    __slots__ = ("started", "calls", "queue_wait", "_lock")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.calls = []  # (endpoint, duration, status)
+        self.queue_wait = 0.0  # 流量制御で待たされた合計
+        self._lock = threading.Lock()
+
+    def add_call(self, endpoint, duration, status):
+        with self._lock:
+            self.calls.append((endpoint, duration, status))
+
+    def add_wait(self, duration):
+        with self._lock:
+            self.queue_wait += duration
+
+
+current_request = contextvars.ContextVar("karapoke_request_stats", default=None)
+
+
+def record_upstream(endpoint, method, status, duration):
+    upstream_calls.inc(endpoint, method, str(status))
+    upstream_latency.observe(duration, endpoint)
+    stats = current_request.get()
+    if stats is not None:
+        stats.add_call(endpoint, duration, status)
+
+
+def record_retry(status):
+    upstream_retries.inc(str(status))
+
+
+def record_queue_wait(priority, duration):
+    upstream_queue_wait.observe(duration, priority)
+    stats = current_request.get()
+    if stats is not None:
+        stats.add_wait(duration)
+
+
+def record_breaker(endpoint, state):
+    breaker_transitions.inc(endpoint, state)
+
+
+def record_stale(section):
+    stale_responses.inc(section)
+
+
+def record_cache(name, hit, count=1):
+    if count:
+        cache_lookups.inc(name, "hit" if hit else "miss", amount=count)
+
+
+def server_timing(stats, total):
+    """Build a Server-Timing header value: total, upstream, then per endpoint."""
+    by_endpoint = {}
+    for endpoint, duration, _ in stats.calls:
+        n, d = by_endpoint.get(endpoint, (0, 0.0))
+        by_endpoint[endpoint] = (n + 1, d + duration)
+    upstream = sum(d for _, d in by_endpoint.values())
+    parts = [
+        f"total;dur={total * 1000:.1f}",
+        f'upstream;dur={upstream * 1000:.1f};desc="{len(stats.calls)} calls"',
+    ]
+    if stats.queue_wait:
+        parts.append(f'queue;dur={stats.queue_wait * 1000:.1f};desc="rate-limit wait"')
+    for endpoint, (n, d) in sorted(by_endpoint.items()):
+        token = "sp-" + "".join(c if c.isalnum() else "-" for c in endpoint).strip("-")
+        parts.append(f'{token};dur={d * 1000:.1f};desc="{n}x {endpoint}"')
+    return ", ".join(parts)
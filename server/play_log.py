@@ -0,0 +1,112 @@
+# server/play_log.py
+# ユーザーごとの再生ログ（追記のみ）
+# Spotify は直近50件しか返さないので、取れた分をローカルに貯めていく。
+# 同期は after カーソル（最後に記録した played_at）以降だけを取りに行く。
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from cache_utils import SingleFlight
+
+RECENT_LIMIT = 50  # current_user_recently_played の上限
+
+
+def played_at_ms(s):
+    # "2026-10-01T12:34:56.789Z" / "2026-10-01T12:34:56Z" -> epoch ms
+    return int(datetime.fromisoformat(s.replace("Z", "+00:00")).timestamp() * 1000)
+
+
+def iso_from_ms(ms):
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(ms / 1000)) + ".%03dZ" % (ms % 1000)
+
+
+class PlayLog:
+    """Append-only per-user play history in SQLite, keyed by (user_id, played_at)."""
+
+    def __init__(self, path=None, sync_interval=30):
+        self.path = path or ":memory:"
+        self.sync_interval = sync_interval  # これより短い間隔の再同期は省く
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        if self.path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS plays ("
+            "user_id TEXT NOT NULL, played_at INTEGER NOT NULL, track_id TEXT NOT NULL, "
+            "PRIMARY KEY (user_id, played_at)) WITHOUT ROWID"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS play_sync ("
+            "user_id TEXT PRIMARY KEY, cursor INTEGER NOT NULL, synced_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def _state(self, user_id):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT cursor, synced_at FROM play_sync WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return row or (0, 0.0)
+
+    def sync(self, sp, user_id, force=False):
+        """Fetch plays newer than the stored cursor; returns the new tracks (may be empty)."""
+        _, synced_at = self._state(user_id)
+        if not force and time.time() - synced_at < self.sync_interval:
+            return []
+        return self._flight.do(user_id, lambda: self._sync(sp, user_id, force))
+
+    def _sync(self, sp, user_id, force):
+        cursor, synced_at = self._state(user_id)
+        if not force and time.time() - synced_at < self.sync_interval:
+            # 待っている間に別リクエストが同期済み
+            return []
+        kwargs = {"limit": RECENT_LIMIT}
+        if cursor:
+            kwargs["after"] = cursor
+        rp = sp.current_user_recently_played(**kwargs) or {}
+        rows = []
+        tracks = []
+        for it in rp.get("items", []):
+            t = it.get("track")
+            if not t or not t.get("id") or not it.get("played_at"):
+                continue
+            ms = played_at_ms(it["played_at"])
+            if ms <= cursor:
+                continue
+            rows.append((user_id, ms, t["id"]))
+            tracks.append(t)
+        new_cursor = max([cursor] + [r[1] for r in rows])
+        with self._lock:
+            self._db.executemany("INSERT OR IGNORE INTO plays (user_id, played_at, track_id) VALUES (?, ?, ?)", rows)
+            self._db.execute(
+                "INSERT OR REPLACE INTO play_sync (user_id, cursor, synced_at) VALUES (?, ?, ?)",
+                (user_id, new_cursor, time.time()),
+            )
+            self._db.commit()
+        if rows:
+            print(f"[PLAYS] {user_id}: +{len(rows)} plays")
+        return tracks
+
+    def recent(self, user_id, limit=20):
+        """[(played_at_ms, track_id)] newest first."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT played_at, track_id FROM plays WHERE user_id = ? ORDER BY played_at DESC LIMIT ?",
+                (user_id, limit),
+            ).fetchall()
+
+    def top(self, user_id, since_ms=0, limit=20):
+        """[(track_id, plays, last_played_ms)] most played since `since_ms`."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT track_id, COUNT(*) AS n, MAX(played_at) AS last FROM plays "
+                "WHERE user_id = ? AND played_at >= ? GROUP BY track_id "
+                "ORDER BY n DESC, last DESC LIMIT ?",
+                (user_id, since_ms, limit),
+            ).fetchall()
+
+    def count(self, user_id):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM plays WHERE user_id = ?", (user_id,)).fetchone()[0]
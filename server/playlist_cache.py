@@ -0,0 +1,81 @@
+# server/playlist_cache.py
+# 編集プレイリストのプロセス共有キャッシュ
+# (playlist_id, market) ごとに保持し、TTL切れ後は snapshot_id で再検証する。
+# 403/404 や使える曲が無かったものは dead に記録し、バックオフ中は上流に問い合わせない。
+# dead への記録は実際に取りに行ったときだけ（キャッシュヒットでバックオフを伸ばさない）。
+import time
+
+import metrics
+from cache_utils import LRUTTLCache, SingleFlight
+from discovery_cache import is_dead_error
+
+
+class PlaylistCache:
+    def __init__(self, maxsize=128, ttl=300, dead=None, usable=None):
+        self._cache = LRUTTLCache(maxsize=maxsize, ttl=ttl)
+        self._flight = SingleFlight()
+        self.dead = dead  # DeadPlaylists（任意）
+        self.usable = usable  # pl -> bool。False なら空として dead に記録する（任意）
+
+    def get(self, sp, playlist_id, market=None):
+        key = (playlist_id, market)
+        pl, expired = self._cache.peek(key)
+        metrics.record_cache("playlists", pl is not None and not expired)
+        if pl is not None and not expired:
+            return pl
+        if self.dead is not None and self.dead.blocked(playlist_id, market):
+            return None
+        # 同じキーの取得は1本にまとめる（コールドミス時の N 重リクエスト防止）
+        return self._flight.do(key, lambda: self._load(sp, key))
+
+    def _load(self, sp, key):
+        playlist_id, market = key
+        pl, expired = self._cache.peek(key)
+        if pl is not None and not expired:
+            # 待っている間に別スレッドが埋めた
+            return pl
+        if pl is not None and pl.get("snapshot_id"):
+            try:
+                head = sp.playlist(playlist_id, fields="snapshot_id", market=market) or {}
+            except Exception:
+                head = {}
+            if head.get("snapshot_id") == pl["snapshot_id"]:
+                self._cache.set(key, pl)
+                return pl
+        try:
+            pl = sp.playlist(playlist_id, market=market)
+        except Exception as e:
+            if self.dead is not None and is_dead_error(e):
+                self.dead.failed(playlist_id, market, f"HTTP {e.http_status}")
+            raise
+        if pl:
+            self._cache.set(key, pl)
+        if self.dead is not None:
+            if pl and (self.usable is None or self.usable(pl)):
+                self.dead.succeeded(playlist_id, market)
+            else:
+                self.dead.failed(playlist_id, market, "empty")
+        return pl
+
+    def invalidate(self, playlist_id, market=None):
+        self._cache.pop((playlist_id, market))
+
+    def clear(self):
+        self._cache.clear()
+
+    # ---- snapshot ----
+    def export_state(self):
+        return [[list(k), v, expires] for k, v, expires in self._cache.items()]
+
+    def import_state(self, state):
+        # 期限切れで戻したものも snapshot_id の再検証に使える（手元の有効な版は上書きしない）
+        now = time.time()
+        count = 0
+        for key, pl, expires in state:
+            key = tuple(key)
+            mine, expired = self._cache.peek(key)
+            if mine is not None and not expired:
+                continue
+            self._cache.set(key, pl, ttl=max(0.0, expires - now))
+            count += 1
+        return count
@@ -0,0 +1,90 @@
+# server/prefetch.py
+# ログイン直後にユーザーごとのデータを先読みするジョブ
+# ジョブはセクション（最近再生・お気に入り・おすすめ・特徴量…）ごとに Future を持ち、
+# 実行中に来たリクエストは同じ Future を待つので上流への二重呼び出しにならない。
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+
+class PrefetchJobs:
+    def __init__(self, ttl=120, max_workers=4):
+        self.ttl = ttl  # 結果を使い回す秒数（過ぎたら通常の経路で取り直す）
+        self.max_workers = max_workers
+        self._jobs = {}  # user_id -> {"started": ts, "sections": {name: Future}, "taken": set()}
+        self._lock = threading.Lock()
+
+    def _prune(self, now):
+        for uid in [uid for uid, job in self._jobs.items() if now - job["started"] > self.ttl]:
+            del self._jobs[uid]
+
+    def start(self, user_id, stages):
+        """Run `stages` (a list of {name: fn(results)}) for `user_id` in the background.
+
+        Sections within a stage run concurrently; each fn receives the results of
+        the earlier stages. Returns immediately.
+        """
+        now = time.time()
+        sections = {name: Future() for stage in stages for name in stage}
+        with self._lock:
+            self._prune(now)
+            self._jobs[user_id] = {"started": now, "sections": sections, "taken": set()}
+
+        def run_one(name, fn, results):
+            fut = sections[name]
+            if not fut.set_running_or_notify_cancel():
+                return
+            try:
+                fut.set_result(fn(results))
+            except BaseException as e:
+                fut.set_exception(e)
+
+        def run():
+            started = time.perf_counter()
+            results = {}
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="prefetch") as pool:
+                for stage in stages:
+                    list(pool.map(lambda item: run_one(item[0], item[1], dict(results)), stage.items()))
+                    for name in stage:
+                        fut = sections[name]
+                        results[name] = fut.result() if fut.exception() is None else None
+            failed = [n for n, f in sections.items() if f.exception() is not None]
+            print(f"[PREFETCH] {user_id}: done in {time.perf_counter() - started:.2f}s"
+                  + (f" (failed: {', '.join(failed)})" if failed else ""))
+
+        threading.Thread(target=run, name=f"prefetch-{user_id}", daemon=True).start()
+
+    def _section(self, user_id, name):
+        if not user_id:
+            return None
+        with self._lock:
+            job = self._jobs.get(user_id)
+            if job is None or time.time() - job["started"] > self.ttl or name in job["taken"]:
+                return None
+            return job["sections"].get(name)
+
+    def wait(self, user_id, name, timeout=10):
+        """Result of a prefetched section (waiting if it is still running); None if unavailable."""
+        fut = self._section(user_id, name)
+        if fut is None:
+            return None
+        try:
+            return fut.result(timeout=timeout)
+        except FutureTimeout:
+            return None
+        except Exception:
+            return None
+
+    def take(self, user_id, name, timeout=10):
+        # 一度きりの結果（おすすめなど）: 最初の1人だけが受け取る
+        result = self.wait(user_id, name, timeout)
+        with self._lock:
+            job = self._jobs.get(user_id)
+            if job is None or name in job["taken"]:
+                return None
+            job["taken"].add(name)
+        return result
+
+    def forget(self, user_id):
+        with self._lock:
+            self._jobs.pop(user_id, None)
@@ -0,0 +1,107 @@
+# server/recommender.py
+# キャッシュ済みのオーディオ特徴量だけで動くローカル推薦
+# - 特徴量は行ごとに正規化した行列に追記していく（容量は倍々で確保）
+# - ユーザーの聴取履歴の平均ベクトルとのコサイン類似度 + 歌いやすさで候補を並べる
+# - 行列そのものが総当たりの近傍インデックス（数万行なら行列×ベクトル1回で数ms）
+import threading
+
+import numpy as np
+
+from audio_features import TARGET_BPM, BPM_WIDTH
+
+# 類似度に使う特徴量と、中心化に使う値（0..1 の特徴は 0.5、tempo/loudness は尺度を揃える）
+FEATURE_COLS = ("danceability", "energy", "valence", "acousticness", "speechiness", "tempo", "loudness", "mode")
+_CENTER = np.array([0.5, 0.5, 0.5, 0.5, 0.1, 120.0, -10.0, 0.5], dtype=np.float32)
+_SCALE = np.array([1.0, 1.0, 1.0, 1.0, 1.0, 60.0, 10.0, 1.0], dtype=np.float32)
+
+# スコア = 類似度 * SIM_WEIGHT + 歌いやすさ * SING_WEIGHT
+SIM_WEIGHT = 0.7
+SING_WEIGHT = 0.3
+# 歌いやすさの内訳（テンポ / エネルギー / ユーザーがよく聴くキー）
+TEMPO_WEIGHT = 0.5
+ENERGY_WEIGHT = 0.3
+KEY_WEIGHT = 0.2
+TARGET_ENERGY = 0.6
+
+
+def _raw(f):
+    return [float(f.get(c) or 0.0) for c in FEATURE_COLS]
+
+
+class Recommender:
+    def __init__(self, capacity=1024):
+        self._lock = threading.Lock()
+        self._index = {}  # track_id -> row
+        self._ids = []
+        self._vecs = np.zeros((capacity, len(FEATURE_COLS)), dtype=np.float32)
+        self._tempo = np.zeros(capacity, dtype=np.float32)
+        self._energy = np.zeros(capacity, dtype=np.float32)
+        self._key = np.zeros(capacity, dtype=np.int8)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _grow(self, need):
+        cap = self._vecs.shape[0]
+        if need <= cap:
+            return
+        while cap < need:
+            cap *= 2
+        for name in ("_vecs", "_tempo", "_energy", "_key"):
+            old = getattr(self, name)
+            new = np.zeros((cap,) + old.shape[1:], dtype=old.dtype)
+            new[:len(self._ids)] = old[:len(self._ids)]
+            setattr(self, name, new)
+
+    def add(self, features):
+        """Append rows for features not seen yet (already-known ids are skipped)."""
+        with self._lock:
+            new = [f for f in features if f and f.get("id") and f["id"] not in self._index]
+            if not new:
+                return 0
+            n = len(self._ids)
+            self._grow(n + len(new))
+            raw = np.array([_raw(f) for f in new], dtype=np.float32)
+            vecs = (raw - _CENTER) / _SCALE
+            norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+            vecs /= np.where(norms > 0, norms, 1.0)
+            end = n + len(new)
+            self._vecs[n:end] = vecs
+            self._tempo[n:end] = raw[:, FEATURE_COLS.index("tempo")]
+            self._energy[n:end] = raw[:, FEATURE_COLS.index("energy")]
+            self._key[n:end] = [int(f.get("key") if f.get("key") is not None else -1) for f in new]
+            for i, f in enumerate(new):
+                self._index[f["id"]] = n + i
+                self._ids.append(f["id"])
+            return len(new)
+
+    def rank(self, seed_ids, candidate_ids, k=10, exclude=()):
+        """Top-k candidate ids by similarity to the seeds plus singability; [] when there is no usable seed."""
+        with self._lock:
+            seeds = np.array([self._index[t] for t in dict.fromkeys(seed_ids) if t in self._index], dtype=np.int64)
+            skip = set(exclude)
+            cand_ids = [t for t in dict.fromkeys(candidate_ids) if t in self._index and t not in skip]
+            if not len(seeds) or not cand_ids:
+                return []
+            rows = np.array([self._index[t] for t in cand_ids], dtype=np.int64)
+            profile = self._vecs[seeds].mean(axis=0)
+            seed_keys = self._key[seeds]
+            cand_vecs = self._vecs[rows]
+            tempo = self._tempo[rows]
+            energy = self._energy[rows]
+            keys = self._key[rows]
+
+        norm = np.linalg.norm(profile)
+        sim = cand_vecs @ (profile / norm) if norm > 0 else np.zeros(len(rows), dtype=np.float32)
+
+        tempo_score = np.clip(1.0 - np.abs(TARGET_BPM - tempo) / BPM_WIDTH, 0.0, None)
+        energy_score = np.clip(1.0 - np.abs(TARGET_ENERGY - energy) / TARGET_ENERGY, 0.0, None)
+        hist = np.bincount(seed_keys[seed_keys >= 0], minlength=12).astype(np.float32)
+        key_score = np.where(keys >= 0, hist[np.clip(keys, 0, 11)] / max(hist.max(), 1.0), 0.0)
+        sing = TEMPO_WEIGHT * tempo_score + ENERGY_WEIGHT * energy_score + KEY_WEIGHT * key_score
+
+        score = SIM_WEIGHT * sim + SING_WEIGHT * sing
+        k = min(k, len(rows))
+        top = np.argpartition(-score, k - 1)[:k]
+        top = top[np.argsort(-score[top])]
+        return [cand_ids[i] for i in top]
@@ -0,0 +1,34 @@
+# server/serve.py
+# 本番起動用エントリポイント（複数ワーカー + gevent + グレースフルシャットダウン）
+#
+#   python serve.py
+#   WEB_CONCURRENCY=4 PORT=8000 python serve.py
+#
+# 開発時は従来どおり python app.py（Flask のデバッグサーバ）で起動する。
+import os
+import sys
+
+from dotenv import load_dotenv
+from gunicorn.app.wsgiapp import run
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def main():
+    # .env の値を優先し、無いものだけ本番向けの既定にする
+    load_dotenv(os.path.join(HERE, ".env"))
+    # ワーカー間でセッションを共有するため、既定はファイル(SQLite)バックエンド
+    os.environ.setdefault("SESSION_BACKEND", "sqlite")
+    # 再生ログも同じ理由でファイルに置く（メモリ上だとワーカーごとに履歴が分かれる）
+    os.environ.setdefault("PLAY_LOG_PATH", os.path.join(HERE, "plays.sqlite3"))
+    sys.argv = [
+        "gunicorn",
+        "--config", os.path.join(HERE, "gunicorn.conf.py"),
+        "--chdir", HERE,
+        "wsgi:app",
+    ] + sys.argv[1:]
+    run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+# server/snapshot.py
+# 共有キャッシュのスナップショット（再起動・デプロイ直後のコールドスタート対策）
+# プレイリスト・検索結果・dead リスト・曲メタデータ・特徴量・ソースインデックス・候補プールを
+# 1ファイルに書き出し、起動時（リクエストを受け付ける前）に読み戻す。ユーザー個別のデータは含めない。
+#
+# ファイル形式（リトルエンディアン）:
+#   header  : magic "KPSNAP" | version u16 | created_at f64 | section count u32
+#   toc     : セクションごとに name_len u16 | offset u64 | size u64 | raw_size u64 | crc32 u32 | name
+#   payload : セクションごとに zlib 圧縮した JSON
+# 目次だけ読めば中身を展開せずにサイズを確認でき、必要なセクションだけ展開できる。
+#
+# 複数ワーカー（gunicorn）では全員が起動時に読み戻すが、書き出すのは <path>.lock を取れた1プロセスだけ。
+# 書き手が終了するとロックが外れ、次に保存のタイミングが来たワーカーが引き継ぐ。
+#
+#   python snapshot.py build cache.snap --markets JP,US     # Spotify から温めて書き出す
+#   python snapshot.py prewarm cache.snap                   # 既存スナップショットの古い部分を取り直す
+#   python snapshot.py inspect cache.snap
+import argparse
+import json
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+MAGIC = b"KPSNAP"
+VERSION = 1
+_HEADER = struct.Struct("<6sHdI")
+_ENTRY = struct.Struct("<HQQQI")
+
+
+class SnapshotError(Exception):
+    pass
+
+
+# ---- file format ----
+def write(path, sections, level=6):
+    """Write {name: json-able state} to `path` atomically; returns the file size."""
+    names = list(sections)
+    blobs = []
+    for name in names:
+        raw = json.dumps(sections[name], ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        blobs.append((raw, zlib.compress(raw, level)))
+    encoded = [n.encode("utf-8") for n in names]
+    offset = _HEADER.size + sum(_ENTRY.size + len(n) for n in encoded)
+    toc = []
+    for n, (raw, blob) in zip(encoded, blobs):
+        toc.append(_ENTRY.pack(len(n), offset, len(blob), len(raw), zlib.crc32(blob)) + n)
+        offset += len(blob)
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, time.time(), len(names)))
+        for entry in toc:
+            f.write(entry)
+        for _, blob in blobs:
+            f.write(blob)
+    os.replace(tmp, path)
+    return offset
+
+
+def read_toc(f):
+    head = f.read(_HEADER.size)
+    if len(head) < _HEADER.size:
+        raise SnapshotError("truncated header")
+    magic, version, created_at, count = _HEADER.unpack(head)
+    if magic != MAGIC:
+        raise SnapshotError("not a snapshot file")
+    if version != VERSION:
+        raise SnapshotError(f"unsupported snapshot version {version}")
+    toc = {}
+    for _ in range(count):
+        entry = f.read(_ENTRY.size)
+        if len(entry) < _ENTRY.size:
+            raise SnapshotError("truncated table of contents")
+        name_len, offset, size, raw_size, crc = _ENTRY.unpack(entry)
+        toc[f.read(name_len).decode("utf-8")] = (offset, size, raw_size, crc)
+    return created_at, toc
+
+
+def read(path, names=None):
+    """Return (created_at, {name: state}) for the requested sections (all by default)."""
+    with open(path, "rb") as f:
+        created_at, toc = read_toc(f)
+        out = {}
+        for name, (offset, size, _, crc) in toc.items():
+            if names is not None and name not in names:
+                continue
+            f.seek(offset)
+            blob = f.read(size)
+            if len(blob) != size or zlib.crc32(blob) != crc:
+                raise SnapshotError(f"section {name} is corrupt")
+            out[name] = json.loads(zlib.decompress(blob))
+    return created_at, out
+
+
+def _entries(state):
+    if isinstance(state, dict) and "sources" in state:
+        return len(state["sources"])
+    return len(state)
+
+
+# ---- in-process save / restore ----
+class Snapshots:
+    def __init__(self, path, sections, interval=600, max_age=86400):
+        self.path = path or None
+        self.sections = sections  # name -> object with export_state() / import_state(state)
+        self.interval = interval
+        self.max_age = max_age  # これより古いスナップショットは読まない（秒）
+        self._lock = threading.Lock()
+        self._started = False
+        self._writer_fd = None
+
+    def _is_writer(self):
+        # 書き手はプロセス1つだけ（ロックはプロセスが終わるまで持ち続ける）
+        if self._writer_fd is not None or fcntl is None:
+            return True
+        fd = os.open(f"{self.path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._writer_fd = fd
+        print(f"[SNAPSHOT] pid {os.getpid()} writes {self.path}")
+        # 前の書き手が最後に書いた分を取り込んでから書く（起動が古いワーカーが上書きで減らさないように）
+        self.restore()
+        return True
+
+    def save(self, force=False):
+        """Write the snapshot if this process is the elected writer (or `force`)."""
+        if not self.path:
+            return
+        if not force and not self._is_writer():
+            return
+        started = time.perf_counter()
+        states = {}
+        for name, obj in self.sections.items():
+            try:
+                states[name] = obj.export_state()
+            except Exception as e:
+                print(f"[SNAPSHOT] failed to export {name}:", e)
+        with self._lock:
+            try:
+                size = write(self.path, states)
+            except Exception as e:
+                print("[SNAPSHOT] failed to save:", e)
+                return
+        print(f"[SNAPSHOT] saved {self.path}: {size / 1024:.0f} KiB in {time.perf_counter() - started:.2f}s")
+
+    def restore(self):
+        if not self.path or not os.path.exists(self.path):
+            return False
+        started = time.perf_counter()
+        try:
+            created_at, states = read(self.path, names=set(self.sections))
+        except Exception as e:
+            print("[SNAPSHOT] failed to read:", e)
+            return False
+        age = time.time() - created_at
+        if self.max_age and age > self.max_age:
+            print(f"[SNAPSHOT] {self.path} is {age:.0f}s old, ignoring")
+            return False
+        counts = []
+        for name, state in states.items():
+            try:
+                counts.append(f"{name}={self.sections[name].import_state(state)}")
+            except Exception as e:
+                print(f"[SNAPSHOT] failed to restore {name}:", e)
+        print(f"[SNAPSHOT] restored {self.path} ({age:.0f}s old) in {time.perf_counter() - started:.2f}s: "
+              + ", ".join(counts))
+        return True
+
+    def start(self):
+        if not self.path or self.interval <= 0:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+
+        def loop():
+            while True:
+                time.sleep(self.interval)
+                self.save()
+
+        threading.Thread(target=loop, name="snapshot-writer", daemon=True).start()
+
+
+# ---- CLI ----
+def _load_app():
+    # app は環境変数を読むので、import 前に起動時の自動復元を止めておく（復元はここで明示的に行う）
+    os.environ["SNAPSHOT_PATH"] = ""
+    import app as server
+    return server
+
+
+def _warm(server, markets, features=True):
+    """Fill the shared caches from Spotify with the app (client-credentials) client."""
+    sp = server._app_spotify()
+    if sp is None:
+        raise SystemExit("SPOTIPY_CLIENT_ID / SPOTIPY_CLIENT_SECRET are required to warm caches")
+    started = time.perf_counter()
+    due = set(server.source_index.due())
+    for market in markets:
+        if server.source_index.get(market) is None or market in due:
+            server.source_index.refresh(sp, server.fanout, markets=[market])
+    keys = [(server.RECOMMENDATION_PLAYLIST_ID, None)]
+    for market in markets:
+        keys += [(e["id"], market) for e in (server.source_index.get(market) or [])[:server.CANDIDATE_POOL_SOURCES]]
+    for pid, market in keys:
+        try:
+            server.candidate_pool.load(sp, pid, server.fanout, market=market)
+        except Exception as e:
+            print(f"[SNAPSHOT] skipping {pid}:", e)
+    ids = server.candidate_pool.track_ids()
+    server.track_store.hydrate(sp, ids, server.fanout, timeout=120)
+    if features:
+        server.feature_store.fetch(sp, ids, server.fanout, timeout=120)
+    print(f"[SNAPSHOT] warmed {len(keys)} sources / {len(ids)} tracks in {time.perf_counter() - started:.1f}s")
+
+
+def cmd_build(args):
+    server = _load_app()
+    _warm(server, args.markets, features=not args.no_features)
+    Snapshots(args.path, server.snapshot_sections()).save(force=True)
+
+
+def cmd_prewarm(args):
+    server = _load_app()
+    snaps = Snapshots(args.path, server.snapshot_sections(), max_age=0)
+    if not snaps.restore():
+        raise SystemExit(f"could not restore {args.path}")
+    _warm(server, args.markets or server.source_index.markets() or ["JP"], features=not args.no_features)
+    snaps.path = args.out or args.path
+    snaps.save(force=True)
+
+
+def cmd_inspect(args):
+    with open(args.path, "rb") as f:
+        created_at, toc = read_toc(f)
+    _, states = read(args.path)
+    info = {
+        "path": args.path,
+        "version": VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(created_at)),
+        "age_s": round(time.time() - created_at),
+        "size": os.path.getsize(args.path),
+        "sections": {
+            name: {"entries": _entries(states[name]), "size": size, "raw_size": raw_size}
+            for name, (_, size, raw_size, _) in toc.items()
+        },
+    }
+    if args.json:
+        print(json.dumps(info, indent=2))
+        return
+    print(f"{info['path']}: v{VERSION}, created {info['created_at']} ({info['age_s']}s ago), {info['size']} bytes")
+    for name, s in info["sections"].items():
+        print(f"  {name:<16} {s['entries']:>8} entries  {s['size']:>10} bytes  (raw {s['raw_size']})")
+
+
+def main(argv=None):
+    def market_list(value):
+        return [m.strip().upper() for m in value.split(",") if m.strip()]
+
+    parser = argparse.ArgumentParser(description="Build, inspect and prewarm shared-cache snapshots.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("build", help="warm the caches from Spotify and write a new snapshot")
+    p.add_argument("path")
+    p.add_argument("--markets", type=market_list, default=["JP"], help="comma-separated markets (default: JP)")
+    p.add_argument("--no-features", action="store_true", help="skip audio features")
+    p.set_defaults(fn=cmd_build)
+
+    p = sub.add_parser("prewarm", help="restore a snapshot, refresh its stale parts and write it back")
+    p.add_argument("path")
+    p.add_argument("--out", help="write to a different file")
+    p.add_argument("--markets", type=market_list, default=None, help="markets to refresh (default: those in the snapshot)")
+    p.add_argument("--no-features", action="store_true", help="skip audio features")
+    p.set_defaults(fn=cmd_prewarm)
+
+    p = sub.add_parser("inspect", help="print the sections of a snapshot")
+    p.add_argument("path")
+    p.add_argument("--json", action="store_true")
+    p.set_defaults(fn=cmd_inspect)
+
+    args = parser.parse_args(argv)
+    try:
+        args.fn(args)
+    except SnapshotError as e:
+        raise SystemExit(f"{args.path}: {e}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+# server/source_index.py
+# おすすめ元プレイリスト候補のマーケット別インデックス
+# バックグラウンドで定期的に作り直し、メモリ（＋任意でJSONファイル）に保持する。
+import json
+import os
+import threading
+import time
+
+from fanout import wait_result
+from discovery_cache import is_dead_error
+from governor import background
+
+SOURCE_QUERIES = [
+    "Top 50 - Japan",
+    "Viral 50 - Japan",
+    "Hot Hits Japan",
+    "J-Pop Now",
+    "J-Rock Now",
+    "Tokyo Super Hits",
+    "New Music Friday Japan",
+]
+
+MAX_ENTRIES = 20
+
+
+def build_sources(sp, market, fanout, timeout=15, query_cache=None, dead=None):
+    """Collect accessible source playlists for `market` (toplists first, then searches)."""
+    deadline = time.monotonic() + timeout
+
+    def toplists():
+        if query_cache is not None:
+            cat = query_cache.category_playlists(sp, "toplists", country=market, limit=20)
+        else:
+            cat = sp.category_playlists("toplists", country=market, limit=20) or {}
+        pls = [p for p in (cat.get("playlists") or {}).get("items", []) if p]
+        # Prefer Japan-related names first
+        preferred = [p for p in pls if isinstance(p.get("name"), str) and (
+            "Japan" in p["name"] or "日本" in p["name"] or "JP" in p["name"]
+        )]
+        return preferred + pls
+
+    def search(q):
+        if query_cache is not None:
+            res = query_cache.search(sp, q, type="playlist", limit=5)
+        else:
+            res = sp.search(q=q, type="playlist", limit=5) or {}
+        return [p for p in (res.get("playlists") or {}).get("items", []) if p]
+
+    def validate(pl):
+        # Validate accessibility by fetching the playlist (only the total is needed)
+        try:
+            pl_full = sp.playlist(pl["id"], fields="id,tracks.total") or {}
+        except Exception as e:
+            if dead is not None and is_dead_error(e):
+                dead.failed(pl["id"], market, f"HTTP {e.http_status}")
+            raise
+        total = (pl_full.get("tracks") or {}).get("total")
+        if not total:
+            if dead is not None:
+                dead.failed(pl["id"], market, "empty")
+            raise ValueError("empty playlist")
+        return total
+
+    listing = [fanout.submit(toplists)] + [fanout.submit(search, q) for q in SOURCE_QUERIES]
+    candidates = []
+    seen = set()
+    for f in listing:
+        for p in wait_result(f, deadline, default=[]):
+            pid = p.get("id")
+            # 最近 403/404/空だったものは問い合わせずに飛ばす
+            if dead is not None and pid and dead.blocked(pid, market):
+                continue
+            if pid and pid not in seen:
+                seen.add(pid)
+                candidates.append(p)
+
+    checks = [(p, fanout.submit(validate, p)) for p in candidates]
+    out = []
+    for p, f in checks:
+        if len(out) >= MAX_ENTRIES:
+            f.cancel()
+            continue
+        try:
+            tracks_total = f.result(timeout=max(0.0, deadline - time.monotonic()))
+        except Exception:
+            # Skip inaccessible playlists
+            continue
+        owner = p.get("owner") or {}
+        out.append({
+            "id": p["id"],
+            "name": p.get("name"),
+            "owner": owner.get("display_name") or owner.get("id"),
+            "tracks_total": tracks_total,
+        })
+    return out
+
+
+class SourceIndex:
+    def __init__(self, path=None, max_age=3600, query_cache=None, dead=None):
+        self.path = path or None
+        self.max_age = max_age
+        self.query_cache = query_cache
+        self.dead = dead
+        self._markets = {}  # market -> {"built_at": ts, "entries": [...]}
+        self._lock = threading.Lock()
+        self._started = False
+        self.load()
+
+    def get(self, market):
+        with self._lock:
+            item = self._markets.get(market)
+            return item["entries"] if item else None
+
+    def put(self, market, entries):
+        with self._lock:
+            self._markets[market] = {"built_at": int(time.time()), "entries": list(entries)}
+        self.save()
+
+    def markets(self):
+        with self._lock:
+            return list(self._markets)
+
+    def due(self):
+        now = time.time()
+        with self._lock:
+            return [m for m, item in self._markets.items() if now - item["built_at"] >= self.max_age]
+
+    # ---- persistence ----
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f) or {}
+            with self._lock:
+                self._markets.update(data.get("markets") or {})
+        except Exception as e:
+            print("[SOURCES] failed to load index:", e)
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = {"markets": dict(self._markets)}
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            print("[SOURCES] failed to save index:", e)
+
+    # ---- snapshot ----
+    def export_state(self):
+        with self._lock:
+            return dict(self._markets)
+
+    def import_state(self, state):
+        # 手元のほうが新しいマーケットはそのまま
+        with self._lock:
+            for market, item in (state or {}).items():
+                mine = self._markets.get(market)
+                if mine is None or mine["built_at"] < item["built_at"]:
+                    self._markets[market] = item
+        return len(state or {})
+
+    # ---- background refresh ----
+    def refresh(self, sp, fanout, markets=None):
+        for market in (markets if markets is not None else self.due()):
+            try:
+                entries = build_sources(sp, market, fanout, query_cache=self.query_cache, dead=self.dead)
+            except Exception as e:
+                print("[SOURCES] refresh failed:", market, e)
+                continue
+            # 一時的に空になっただけなら手元の一覧は残す（空のままのマーケットは built_at を進める）
+            if entries or not self.get(market):
+                self.put(market, entries)
+                print("[SOURCES] refreshed:", market, len(entries))
+
+    def start_refresher(self, sp_factory, fanout, interval=300):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    sp = sp_factory()
+                    if sp is not None:
+                        # 画面表示の呼び出しを優先させる
+                        with background():
+                            self.refresh(sp, fanout)
+                except Exception as e:
+                    print("[SOURCES] refresher error:", e)
+
+        threading.Thread(target=loop, name="source-index-refresher", daemon=True).start()
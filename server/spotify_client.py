@@ -0,0 +1,203 @@
+# server/spotify_client.py
+# Spotify クライアントの生成をまとめる
+# すべてのクライアントで1つの requests.Session（keep-alive 接続プール）を共有し、
+# ユーザーごとのトークンだけを差し替える。
+import re
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import spotipy
+from spotipy.oauth2 import SpotifyOAuth, SpotifyClientCredentials
+from spotipy.cache_handler import CacheHandler, MemoryCacheHandler
+from spotipy.exceptions import SpotifyException
+
+import metrics
+
+API_PREFIX = "https://api.spotify.com/v1/"
+_ID_SEGMENT = re.compile(r"^[0-9A-Za-z]{22}$")
+_ID_PARENTS = {"users", "categories"}
+
+
+def endpoint_label(url):
+    # "playlists/37i9dQZF1DXcBWIGoYBM5M/tracks" -> "playlists/{id}/tracks"
+    path = url.split("?", 1)[0]
+    if path.startswith(API_PREFIX):
+        path = path[len(API_PREFIX):]
+    elif "/v1/" in path:
+        path = path.split("/v1/", 1)[1]
+    segs = [s for s in path.split("/") if s]
+    out = []
+    for i, seg in enumerate(segs):
+        if _ID_SEGMENT.match(seg) or (i > 0 and segs[i - 1] in _ID_PARENTS):
+            out.append("{id}")
+        else:
+            out.append(seg)
+    return "/".join(out) or "/"
+
+
+class InstrumentedSpotify(spotipy.Spotify):
+    # すべての Spotify 呼び出しはここを通る（計測・流量制御・遮断の差し込み口）
+    governor = None
+    breakers = None
+
+    def __del__(self):
+        # spotipy は破棄時にセッションを close するが、セッションは SpotifyClientFactory が持つ共有物。
+        # リクエストごとのクライアントが捨てられるたびに接続プールが閉じられないよう何もしない
+        pass
+
+    def _internal_call(self, method, url, payload, params):
+        endpoint = endpoint_label(url)
+        if self.breakers is not None:
+            # open なら上流に行かずにすぐ失敗させる（CircuitOpen）
+            self.breakers.before(endpoint)
+        if self.governor is not None:
+            try:
+                self.governor.acquire()
+            except Exception:
+                if self.breakers is not None:
+                    self.breakers.cancel(endpoint)
+                raise
+        started = time.perf_counter()
+        status = 200
+        try:
+            result = super()._internal_call(method, url, payload, params)
+            if self.governor is not None:
+                self.governor.succeeded()
+            return result
+        except SpotifyException as e:
+            status = getattr(e, "http_status", None) or 0
+            raise
+        except Exception:
+            status = 0
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            metrics.record_upstream(endpoint, method, status, duration)
+            if self.breakers is not None:
+                self.breakers.record(endpoint, status, duration)
+
+
+class _CappedRetry(Retry):
+    # Retry-After は尊重するが、極端に長い待ちでワーカーを塞がない
+    retry_after_max = 10
+    governor = None
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, self.retry_after_max)
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        if response is not None:
+            metrics.record_retry(response.status)
+            if response.status == 429 and self.governor is not None:
+                self.governor.throttled(self.get_retry_after(response))
+        return super().increment(method, url, response, error, _pool, _stacktrace)
+
+    def sleep(self, response=None):
+        super().sleep(response)
+        # 再送も1回の呼び出しとしてバケットから払う
+        if self.governor is not None:
+            self.governor.acquire()
+
+    def new(self, **kw):
+        retry = super().new(**kw)
+        retry.retry_after_max = self.retry_after_max
+        retry.governor = self.governor
+        return retry
+
+
+class _NullCacheHandler(CacheHandler):
+    # OAuth は全ユーザーで共有するので、トークンを内部にキャッシュさせない
+    def get_cached_token(self):
+        return None
+
+    def save_token_to_cache(self, token_info):
+        return None
+
+
+class SpotifyClientFactory:
+    def __init__(self, client_id=None, client_secret=None, redirect_uri=None, scope=None,
+                 pool_size=20, timeout=5, retries=3, backoff=0.3, retry_after_max=10, api_base=None,
+                 governor=None, breakers=None):
+        self.client_id = client_id
+        self.governor = governor  # None なら流量制御なし
+        self.breakers = breakers  # None ならサーキットブレーカーなし
+        self.api_base = api_base or None  # ローカルのスタンドイン（fake_spotify.py）に向ける場合
+        self.client_secret = client_secret
+        self.redirect_uri = redirect_uri
+        self.scope = scope
+        self.timeout = timeout
+
+        retry = _CappedRetry(
+            total=retries,
+            connect=retries,
+            read=False,
+            status=retries,
+            backoff_factor=backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(["GET", "POST", "PUT", "DELETE"]),
+            respect_retry_after_header=True,
+        )
+        retry.retry_after_max = retry_after_max
+        retry.governor = governor
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._oauth = None
+        self._app_client = None
+
+    def client(self, access_token, timeout=None):
+        # 生成は軽量（接続は共有セッション側で再利用される）
+        sp = InstrumentedSpotify(
+            auth=access_token,
+            requests_session=self.session,
+            requests_timeout=timeout or self.timeout,
+        )
+        sp.governor = self.governor
+        sp.breakers = self.breakers
+        if self.api_base:
+            sp.prefix = self.api_base
+        return sp
+
+    def oauth(self):
+        if self._oauth is None:
+            self._oauth = SpotifyOAuth(
+                client_id=self.client_id,
+                client_secret=self.client_secret,
+                redirect_uri=self.redirect_uri,
+                scope=self.scope,
+                cache_handler=_NullCacheHandler(),
+                show_dialog=True,  # アカウント選択を毎回出す
+                requests_session=self.session,
+                requests_timeout=self.timeout,
+            )
+        return self._oauth
+
+    def app_client(self):
+        # ユーザーに紐づかないバックグラウンド処理用（Client Credentials）
+        if not (self.client_id and self.client_secret):
+            return None
+        if self._app_client is None:
+            self._app_client = InstrumentedSpotify(
+                auth_manager=SpotifyClientCredentials(
+                    client_id=self.client_id,
+                    client_secret=self.client_secret,
+                    cache_handler=MemoryCacheHandler(),
+                    requests_session=self.session,
+                    requests_timeout=self.timeout,
+                ),
+                requests_session=self.session,
+                requests_timeout=self.timeout,
+            )
+            self._app_client.governor = self.governor
+            self._app_client.breakers = self.breakers
+            if self.api_base:
+                self._app_client.prefix = self.api_base
+        return self._app_client
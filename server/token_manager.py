@@ -0,0 +1,97 @@
+# server/token_manager.py
+# アクセストークンの更新管理
+# - 同じ refresh_token の同時更新は1回の上流呼び出しにまとめる
+# - 最近使われたトークンは期限切れ前にバックグラウンドで更新しておく
+import threading
+import time
+
+from cache_utils import SingleFlight
+
+
+class TokenManager:
+    def __init__(self, oauth_factory, margin=60, ahead=300, idle_ttl=3600):
+        self.oauth_factory = oauth_factory
+        self.margin = margin      # これより残りが少なければリクエスト内で同期更新
+        self.ahead = ahead        # これより残りが少なければバックグラウンドで先回り更新
+        self.idle_ttl = idle_ttl  # この秒数使われていないトークンは追跡をやめる
+        self._flight = SingleFlight()
+        self._latest = {}  # refresh_token -> {"token_info": ..., "seen": ts}
+        self._lock = threading.Lock()
+        self._started = False
+
+    def _track(self, refresh_token, token_info, touch=True):
+        with self._lock:
+            item = self._latest.get(refresh_token)
+            seen = time.time() if touch or not item else item["seen"]
+            self._latest[refresh_token] = {"token_info": token_info, "seen": seen}
+
+    def ensure(self, token_info):
+        """Return a usable token_info, refreshing only when it is about to expire."""
+        rt = token_info.get("refresh_token")
+        if not rt:
+            return token_info
+        with self._lock:
+            item = self._latest.get(rt)
+        # バックグラウンドで更新済みならそれを使う
+        if item and (item["token_info"].get("expires_at") or 0) > (token_info.get("expires_at") or 0):
+            token_info = item["token_info"]
+        self._track(rt, token_info)
+        expires_at = token_info.get("expires_at")
+        if expires_at and expires_at - int(time.time()) < self.margin:
+            token_info = self.refresh(rt)
+        return token_info
+
+    def refresh(self, refresh_token):
+        return self._flight.do(refresh_token, lambda: self._refresh(refresh_token))
+
+    def _refresh(self, refresh_token):
+        with self._lock:
+            item = self._latest.get(refresh_token)
+        # 待っている間に他のリクエストが更新済み
+        if item and (item["token_info"].get("expires_at") or 0) - int(time.time()) >= self.ahead:
+            return item["token_info"]
+        token_info = self.oauth_factory().refresh_access_token(refresh_token)
+        self._track(refresh_token, token_info, touch=False)
+        new_rt = token_info.get("refresh_token")
+        if new_rt and new_rt != refresh_token:
+            self._track(new_rt, token_info, touch=False)
+        print("[AUTH] token refreshed")
+        return token_info
+
+    def forget(self, refresh_token):
+        with self._lock:
+            self._latest.pop(refresh_token, None)
+
+    # ---- background refresh ----
+    def refresh_due(self):
+        now = time.time()
+        with self._lock:
+            for rt in [rt for rt, item in self._latest.items() if now - item["seen"] > self.idle_ttl]:
+                del self._latest[rt]
+            # ローテーション済みの古い refresh_token は新しい方に任せる
+            due = [rt for rt, item in self._latest.items()
+                   if item["token_info"].get("refresh_token", rt) == rt
+                   and (item["token_info"].get("expires_at") or 0) - now < self.ahead]
+        for rt in due:
+            try:
+                self.refresh(rt)
+            except Exception as e:
+                # 失敗したらリクエスト側の同期更新に任せる
+                print("[AUTH] background refresh failed:", e)
+                self.forget(rt)
+
+    def start(self, interval=30):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.refresh_due()
+                except Exception as e:
+                    print("[AUTH] token refresher error:", e)
+
+        threading.Thread(target=loop, name="token-refresher", daemon=True).start()
@@ -0,0 +1,54 @@
+# server/track_store.py
+# トラックのメタデータを共有ストアに保持し、足りない分だけ Spotify から取得する
+import time
+
+from fanout import wait_result
+from kv_store import JsonStore
+
+TRACKS_BATCH = 50  # sp.tracks() の上限
+
+
+def compact_track(t):
+    # UI が読むフィールドだけに絞る（available_markets などは落とす）
+    if not t:
+        return t
+    album = t.get("album") or {}
+    return {
+        "id": t.get("id"),
+        "name": t.get("name"),
+        "uri": t.get("uri"),
+        "duration_ms": t.get("duration_ms"),
+        "popularity": t.get("popularity"),
+        "artists": [{"id": a.get("id"), "name": a.get("name")} for a in (t.get("artists") or [])],
+        "album": {"id": album.get("id"), "name": album.get("name"), "images": album.get("images") or []},
+        "external_urls": {"spotify": (t.get("external_urls") or {}).get("spotify")},
+    }
+
+
+class TrackStore(JsonStore):
+    def __init__(self, path=None, maxsize=5000):
+        super().__init__("tracks", path=path, maxsize=maxsize)
+
+    def add_tracks(self, tracks):
+        self.put_many({t["id"]: t for t in (tracks or []) if t and t.get("id") and not t.get("is_local")})
+
+    def hydrate(self, sp, ids, fanout, timeout=10):
+        """Return {id: track} for `ids`, batch-fetching only the misses concurrently."""
+        ids = list(dict.fromkeys(tid for tid in ids if tid))
+        found = self.get_many(ids)
+        misses = [tid for tid in ids if tid not in found]
+        if not misses or sp is None:
+            return found
+        deadline = time.monotonic() + timeout
+
+        def fetch(chunk):
+            resp = sp.tracks(chunk) or {}
+            return [t for t in (resp.get("tracks") or []) if t and t.get("id")]
+
+        futs = [fanout.submit(fetch, misses[i:i + TRACKS_BATCH]) for i in range(0, len(misses), TRACKS_BATCH)]
+        for f in futs:
+            fetched = wait_result(f, deadline, default=[])
+            self.add_tracks(fetched)
+            for t in fetched:
+                found[t["id"]] = t
+        return found
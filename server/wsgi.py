@@ -0,0 +1,3 @@
+# server/wsgi.py
+# 本番用 WSGI エントリポイント（gunicorn から読み込む）
+from app import app, shutdown_background_jobs  # noqa: F401